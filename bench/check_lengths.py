@@ -0,0 +1,65 @@
+"""Opcode length check.
+
+Runs every fixed-length transform handler on a stub instruction and fails if
+its step differs from bytecode.OPCODE_LENGTHS, the table shared with
+instruction_length and scan_instructions. Handlers hard-code their step for
+speed, so run this after changing either.
+"""
+import os.path
+import sys
+from array import array
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+from bytecode import DISPATCH_TABLE, OPCODE_LENGTHS, OperandKind  # noqa: E402
+from constpool import CONST  # noqa: E402
+
+
+class StubPool:
+    """Constant pool stand-in mapping every ROM index to a double."""
+
+    new_index = array("i", [0])
+    new_type = bytearray(CONST.DOUBLE)
+
+    def get_transform(self, index):
+        return self.new_index[index]
+
+    def add(self, value_type, value):
+        return 1
+
+    def get_int(self, index):
+        return 0
+
+
+def check_handler_lengths() -> list[str]:
+    """Returns mismatches between handler steps and OPCODE_LENGTHS."""
+    errors = []
+    for opcode, (kind, handler) in enumerate(DISPATCH_TABLE):
+        if handler is None or kind == OperandKind.INVOKEINTERFACE:
+            continue
+        if not OPCODE_LENGTHS[opcode]:
+            # Switch lengths come from their operands
+            continue
+        bytecode = bytearray(8)
+        bytecode[0] = opcode
+        step = handler(bytecode, 0, bytearray(), StubPool(), {})
+        if step != OPCODE_LENGTHS[opcode]:
+            errors.append(
+                f"opcode {opcode:#04x} ({kind.name}): handler steps {step}, "
+                f"table says {OPCODE_LENGTHS[opcode]}"
+            )
+    return errors
+
+
+def _main():
+    errors = check_handler_lengths()
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors:
+        sys.exit(1)
+    print("handler steps match OPCODE_LENGTHS")
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,204 @@
+"""Benchmark runner.
+
+Times each conversion stage (parse, CP build, bytecode transform, serialize,
+zip) on a synthetic or given JXE and stores results as JSON, so runs from
+different commits can be compared with --compare. Peak memory is measured on
+a separate write_jar run in a fresh process.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import os.path
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+import synth  # noqa: E402
+from bytecode import scan_instructions, transform_bytecode  # noqa: E402
+from common import ReaderStream, WriterStream  # noqa: E402
+from constpool import ConstPool  # noqa: E402
+from jxe import JXE  # noqa: E402
+from jxe2jar import dump_romclass, write_jar  # noqa: E402
+
+STAGES = ("parse", "cp_build", "transform", "serialize", "zip")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCH_DIR,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_once(jxe_name) -> dict:
+    """Returns stage timings (seconds) and sizes of one conversion."""
+    timings = dict.fromkeys(STAGES, 0.0)
+    clock = time.perf_counter
+
+    start = clock()
+    with open(jxe_name, "rb") as fp_jxe:
+        classes = JXE.read(ReaderStream(fp_jxe)).image.classes
+        romclasses = [classes[i] for i in range(len(classes))]
+    timings["parse"] = clock() - start
+
+    start = clock()
+    pools = [ConstPool(romclass) for romclass in romclasses]
+    timings["cp_build"] = clock() - start
+
+    start = clock()
+    for romclass, const_pool in zip(romclasses, pools):
+        for method in romclass.methods:
+            transform_bytecode(bytearray(method.bytecode), method.signature, const_pool)
+    timings["transform"] = clock() - start
+
+    # dump_romclass repeats CP build and transform, they are subtracted below
+    start = clock()
+    class_files = []
+    for romclass in romclasses:
+        stream = WriterStream()
+        dump_romclass(stream, romclass)
+        class_files.append((romclass.class_name, stream.getvalue()))
+    timings["serialize"] = max(
+        0.0, clock() - start - timings["cp_build"] - timings["transform"]
+    )
+
+    start = clock()
+    jar = io.BytesIO()
+    with zipfile.ZipFile(jar, "w") as jar_zipfile:
+        for class_name, data in class_files:
+            jar_zipfile.writestr(f"{class_name}.class", data)
+    timings["zip"] = clock() - start
+
+    return {
+        "timings": timings,
+        "classes": len(romclasses),
+        "methods": sum(len(romclass.methods) for romclass in romclasses),
+        "instructions": sum(
+            len(scan_instructions(method.bytecode))
+            for romclass in romclasses
+            for method in romclass.methods
+        ),
+        "bytes_in": os.path.getsize(jxe_name),
+        "bytes_out": len(jar.getvalue()),
+    }
+
+
+def _write_jar_child(jxe_name, jar_name) -> None:
+    """Runs write_jar in this process and prints its time and peak RSS."""
+    start = time.perf_counter()
+    write_jar(jxe_name, jar_name)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    maxrss = maxrss // 1024 if sys.platform == "darwin" else maxrss
+    print(json.dumps({"write_jar": seconds, "peak_rss_kib": maxrss}))
+
+
+def measure_write_jar(jxe_name, tmp_dir) -> dict:
+    """Returns time and peak RSS of write_jar, run in a fresh process.
+
+    Keeps the generator and the staged benchmark out of the measured memory.
+    """
+    output = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--write-jar-child",
+            jxe_name,
+            os.path.join(tmp_dir, "out.jar"),
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def run(jxe_name, repeat) -> dict:
+    """Runs benchmark repeat times, keeps the fastest time of each stage."""
+    runs = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            runs.append(run_once(jxe_name))
+    result = {key: value for key, value in runs[0].items() if key != "timings"}
+    result["timings"] = {
+        stage: min(one["timings"][stage] for one in runs) for stage in STAGES
+    }
+    result["timings"]["total"] = sum(result["timings"].values())
+    return result
+
+
+def compare(result, baseline) -> None:
+    """Prints per-stage comparison against a previous result."""
+    print(f"{'stage':<10} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for stage in (*STAGES, "total"):
+        old = baseline["timings"].get(stage)
+        new = result["timings"][stage]
+        ratio = f"{new / old:7.2f}" if old else f"{'-':>7}"
+        print(f"{stage:<10} {old or 0:10.4f} {new:10.4f} {ratio}")
+    old = baseline.get("write_jar")
+    new = result["write_jar"]
+    ratio = f"{new / old:7.2f}" if old else f"{'-':>7}"
+    print(f"{'write_jar':<10} {old or 0:10.4f} {new:10.4f} {ratio}")
+    print(
+        f"{'peak_rss':<10} {baseline.get('peak_rss_kib', 0):>9}K "
+        f"{result['peak_rss_kib']:>9}K"
+    )
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Benchmarks JXE conversion.")
+    parser.add_argument("--jxe", help="benchmark this JXE instead of a synthetic")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage")
+    parser.add_argument("-o", "--output", help="write JSON result to file")
+    parser.add_argument("--compare", metavar="JSON", help="previous JSON result")
+    parser.add_argument(
+        "--write-jar-child", nargs=2, metavar=("JXE", "JAR"), help=argparse.SUPPRESS
+    )
+    synth.add_arguments(parser)
+    args = parser.parse_args()
+    if args.write_jar_child:
+        _write_jar_child(*args.write_jar_child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jxe_name = args.jxe
+        if jxe_name is None:
+            jxe_name = os.path.join(tmp_dir, "synthetic.jxe")
+            synth.build_jxe(jxe_name, args)
+        result = run(jxe_name, args.repeat)
+        result.update(measure_write_jar(jxe_name, tmp_dir))
+
+    result["commit"] = _git_commit()
+    result["python"] = platform.python_version()
+    result["params"] = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("output", "compare", "write_jar_child")
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp_output:
+            json.dump(result, fp_output, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fp_baseline:
+            compare(result, json.load(fp_baseline))
+
+
+if __name__ == "__main__":
+    _main()
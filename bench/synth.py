@@ -0,0 +1,415 @@
+"""Synthetic JXE generator.
+
+Builds valid rom.classes images (wrapped into a JXE archive) with a
+configurable number of classes, methods, constants and a bytecode mix that
+covers the J9 specific opcodes handled by bytecode.transform_bytecode.
+"""
+import argparse
+import random
+import struct
+import zipfile
+import zlib
+
+HEADER_SIZE = 0x30
+ROMCLASS_HEADER_SIZE = 0x68
+
+INT, STRING, CLASS = 0, 1, 2
+
+OPCODES_SIMPLE = (
+    0x00,  # nop
+    0x03,  # iconst_0
+    0x04,  # iconst_1
+    0x1A,  # iload_0
+    0x1B,  # iload_1
+    0x2A,  # aload_0
+    0x57,  # pop
+    0x59,  # dup
+    0x60,  # iadd
+    0x64,  # isub
+    0x68,  # imul
+    0x85,  # i2l
+    0xBE,  # arraylength
+)
+
+
+class Image:
+    """Builds rom.classes layout with self-relative pointer fixups."""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.strings = {}
+        self.fixups = []
+
+    def tell(self):
+        return len(self.buf)
+
+    def u8(self, value):
+        self.buf += struct.pack("<B", value)
+
+    def u16(self, value):
+        self.buf += struct.pack("<H", value)
+
+    def u32(self, value):
+        self.buf += struct.pack("<I", value & 0xFFFFFFFF)
+
+    def srp(self, target):
+        """Reserves a self-relative pointer to an offset or a utf8 string."""
+        self.fixups.append((self.tell(), target))
+        self.u32(0)
+
+    def align(self):
+        while len(self.buf) & 3:
+            self.buf.append(0)
+
+    def finish(self):
+        for value in self.strings:
+            self.align()
+            self.strings[value] = self.tell()
+            data = value.encode("utf-8")
+            self.u16(len(data))
+            self.buf += data
+        self.align()
+        for pos, target in self.fixups:
+            if isinstance(target, str):
+                target = self.strings[target]
+            elif isinstance(target, list):
+                target = target[0]
+            struct.pack_into("<i", self.buf, pos, target - pos)
+        return bytes(self.buf)
+
+    def string(self, value):
+        self.strings.setdefault(value, None)
+        return value
+
+
+def _class_name(index):
+    return f"com/example/pkg{index % 7}/Class{index}"
+
+
+def _gen_bytecode(rng, cp, temps, switch_size):
+    """Generates a J9 bytecode blob that exercises the transformer."""
+    code = bytearray()
+
+    def u16(value):
+        code.extend(struct.pack("<H", value))
+
+    def i32(value):
+        code.extend(struct.pack("<i", value))
+
+    for _ in range(rng.randint(4, 24)):
+        kind = rng.randrange(12)
+        if kind == 0:
+            code.append(rng.choice(OPCODES_SIMPLE))
+        elif kind == 1:
+            code.append(0x10)  # bipush
+            code.append(rng.randrange(256))
+            code.append(0x11)  # sipush
+            u16(rng.randrange(65536))
+        elif kind == 2 and cp["ldc"]:
+            code.append(0x12)  # ldc
+            code.append(rng.choice(cp["ldc"]))
+            code.append(0x13)  # ldc_w
+            u16(rng.choice(cp["ldc"]))
+        elif kind == 3 and cp["long"]:
+            code.append(0x14)  # ldc2_w
+            u16(rng.choice(cp["long"]))
+        elif kind == 4 and cp["fieldref"]:
+            code.append(rng.choice((0xB2, 0xB3, 0xB4, 0xB5)))
+            u16(rng.choice(cp["fieldref"]))
+            code.append(0xD7)  # aload0getfield
+        elif kind == 5 and cp["methodref"]:
+            code.append(rng.choice((0xB6, 0xB7, 0xB8)))
+            u16(rng.choice(cp["methodref"]))
+        elif kind == 6 and cp["methodref"]:
+            code.extend(b"\xe7\x00\xb9")  # invokeinterface2 nop invokeinterface
+            u16(rng.choice(cp["methodref"]))
+        elif kind == 7 and cp["class"]:
+            code.append(rng.choice((0xBB, 0xBD, 0xC0, 0xC1)))
+            u16(rng.choice(cp["class"]))
+        elif kind == 8:
+            code.append(0x15)  # iload
+            code.append(rng.randrange(temps))
+            code.append(0x84)  # iinc
+            code.append(rng.randrange(temps))
+            code.append(1)
+            code.append(0xCB)  # iloadw
+            u16(rng.randrange(temps))
+            code.append(0xD5)  # iincw
+            u16(rng.randrange(temps))
+            u16(1)
+        elif kind == 9:
+            code.append(rng.choice((0x99, 0x9A, 0xA7)))
+            u16(3)
+        elif kind == 10:
+            code.append(0xAA)  # tableswitch
+            code.extend(b"\x00" * ((4 - len(code) % 4) % 4))
+            low = rng.randint(-5, 5)
+            count = rng.randint(1, switch_size)
+            i32(8)
+            i32(low)
+            i32(low + count - 1)
+            for _ in range(count):
+                i32(rng.randint(-100, 100))
+        elif kind == 11:
+            code.append(0xAB)  # lookupswitch
+            code.extend(b"\x00" * ((4 - len(code) % 4) % 4))
+            count = rng.randint(0, switch_size)
+            i32(8)
+            i32(count)
+            for key in sorted(rng.sample(range(-1000, 1000), count)):
+                i32(key)
+                i32(rng.randint(-100, 100))
+    code.append(rng.choice((0xAC, 0xAD, 0xAE, 0xE4)))
+    return bytes(code)
+
+
+def _write_class(image, index, rng, args):
+    """Writes one ROM class and returns (name, offset)."""
+    name = _class_name(index)
+    start = image.tell()
+    cp_base = start + ROMCLASS_HEADER_SIZE
+
+    # Constant pool plan: [0] INT, strings, classes, refs, ints, longs (last).
+    entries = [("int", 0)]
+    cp = {"ldc": [], "class": [], "fieldref": [], "methodref": [], "long": []}
+    for i in range(args.strings):
+        cp["ldc"].append(len(entries))
+        entries.append(("string", f"string constant {i} of {name}"))
+    class_names = [name, "java/lang/Object"] + [
+        _class_name(rng.randrange(args.classes)) for _ in range(args.class_refs)
+    ]
+    class_slots = []
+    for value in class_names:
+        class_slots.append(len(entries))
+        cp["class"].append(len(entries))
+        entries.append(("class", value))
+    for i in range(args.refs):
+        is_method = i % 2 == 0
+        kind = "methodref" if is_method else "fieldref"
+        cp[kind].append(len(entries))
+        descriptor = f"(I{'J' * (i % 3)})V" if is_method else "I"
+        entries.append(
+            ("ref", (rng.choice(class_slots), f"member{i % 11}", descriptor))
+        )
+    for i in range(args.ints):
+        cp["ldc"].append(len(entries))
+        entries.append(("int", rng.randrange(1 << 32)))
+    for i in range(args.longs):
+        cp["long"].append(len(entries))
+        # High bits keep read_constant_pool from mistaking the long for a REF
+        hi_word = rng.randrange(1 << 31) | 0x80000000
+        entries.append(("long", (hi_word, 0x40000000 + i)))
+    cp["ldc"] = [idx for idx in cp["ldc"] if idx < 256]
+
+    interfaces = [_class_name(rng.randrange(args.classes)) for _ in range(2)]
+    methods = []
+    for i in range(args.methods):
+        temps = rng.randint(2, 8)
+        native = args.natives and i == 0
+        methods.append(
+            {
+                "name": f"method{i}",
+                "signature": ("(I)V", "(I)I", "(I)J", "(I)F")[i % 4],
+                "temps": temps,
+                "native": native,
+                "code": b""
+                if native
+                else _gen_bytecode(rng, cp, temps, args.switch_size),
+                "catches": [(0, 1, 1, cp["class"][0])] if i % 3 == 1 else [],
+                "throws": ["java/lang/Exception"] if i % 3 == 1 else [],
+            }
+        )
+    fields = [
+        (f"field{i}", ("I", "J", "Ljava/lang/String;")[i % 3])
+        for i in range(args.fields)
+    ]
+
+    # Header.
+    interfaces_ptr, methods_ptr, fields_ptr = [None], [None], [None]
+    rom_size_pos = image.tell()
+    image.u32(0)  # rom_size
+    image.u32(0)  # single_scalar_static_count
+    image.srp(image.string(name))
+    image.srp(image.string("java/lang/Object"))
+    image.u32(0x21)  # access_flags
+    image.u32(len(interfaces))
+    image.srp(interfaces_ptr)
+    image.u32(len(methods))
+    image.srp(methods_ptr)
+    image.u32(len(fields))
+    image.srp(fields_ptr)
+    image.u32(0)  # object_static_count
+    image.u32(0)  # double_scalar_static_count
+    image.u32(len(entries))  # ram_constant_pool_count
+    image.u32(len(entries))  # rom_constant_pool_count
+    crc_pos = image.tell()
+    image.u32(0)  # crc
+    image.u32(8)  # instance_size
+    image.u32(0)  # instance_shape
+    image.u32(0)  # cp_shape_description
+    image.u32(0)  # outer_class_name
+    image.u32(0)  # member_access_flags
+    image.u32(0)  # inner_class_count
+    image.u32(0)  # inner_classes
+    image.u16(args.major)
+    image.u16(args.minor)
+    image.u32(0x2000)  # optional_flags
+    image.u32(0)  # optional_info
+    assert image.tell() == cp_base
+
+    nas_ptrs = []
+    for kind, value in entries:
+        if kind == "int":
+            image.u32(value)
+            image.u32(INT)
+        elif kind == "string":
+            image.srp(image.string(value))
+            image.u32(STRING)
+        elif kind == "class":
+            image.srp(image.string(value))
+            image.u32(CLASS)
+        elif kind == "ref":
+            image.u32(value[0])
+            ptr = [None]
+            nas_ptrs.append((ptr, value[1], value[2]))
+            image.srp(ptr)
+        elif kind == "long":
+            image.u32(value[0])
+            image.u32(value[1])
+
+    interfaces_ptr[0] = image.tell()
+    for value in interfaces:
+        image.srp(image.string(value))
+
+    methods_ptr[0] = image.tell()
+    for method in methods:
+        image.srp(image.string(method["name"]))
+        image.srp(image.string(method["signature"]))
+        modifier = 0x1
+        if method["catches"] or method["throws"]:
+            modifier |= 0x20000
+        if method["native"]:
+            modifier |= 0x100
+        image.u32(modifier)
+        image.u16(4)  # max_stack
+        if method["native"]:
+            for value in (1, method["temps"], 0, 1, 0, 0, 1, 0, 1):
+                image.u8(value)
+            image.align()
+            continue
+        code = method["code"]
+        image.u16(len(code) & 0xFFFF)
+        image.u8(len(code) >> 16)
+        image.u8(1)  # arg_count
+        image.u16(method["temps"])
+        image.buf += code
+        image.align()
+        if modifier & 0x20000:
+            image.u16(len(method["catches"]))
+            image.u16(len(method["throws"]))
+            for catch in method["catches"]:
+                for value in catch:
+                    image.u32(value)
+            for value in method["throws"]:
+                image.srp(image.string(value))
+
+    fields_ptr[0] = image.tell()
+    for field_name, signature in fields:
+        image.srp(image.string(field_name))
+        image.srp(image.string(signature))
+        image.u32(0x1)
+
+    for ptr, member, descriptor in nas_ptrs:
+        ptr[0] = image.tell()
+        image.srp(image.string(member))
+        image.srp(image.string(descriptor))
+
+    size = image.tell() - start
+    struct.pack_into("<I", image.buf, rom_size_pos, size)
+    crc = zlib.crc32(image.buf[start:]) & 0xFFFFFFFF
+    struct.pack_into("<I", image.buf, crc_pos, crc)
+    return name, start
+
+
+def build_rom_classes(args) -> bytes:
+    """Builds a rom.classes image."""
+    rng = random.Random(args.seed)
+    image = Image()
+    image.u32(0x4A394F4D)  # signature
+    image.u32(0)  # flags_and_version
+    rom_size_pos = image.tell()
+    image.u32(0)
+    image.u32(args.classes)
+    image.u32(0)  # jxe_pointer
+    toc_ptr, first_class_ptr = [None], [None]
+    image.srp(toc_ptr)
+    image.srp(first_class_ptr)
+    image.u32(0)  # aot_pointer
+    image.buf += bytes(range(16))
+    assert image.tell() == HEADER_SIZE
+
+    toc_ptr[0] = image.tell()
+    image.buf += bytes(8 * args.classes)
+    for i in range(args.classes):
+        name, offset = _write_class(image, i, rng, args)
+        if i == 0:
+            first_class_ptr[0] = offset
+        pos = toc_ptr[0] + 8 * i
+        image.fixups.append((pos, image.string(name)))
+        image.fixups.append((pos + 4, offset))
+    data = bytearray(image.finish())
+    struct.pack_into("<I", data, rom_size_pos, len(data))
+    return bytes(data)
+
+
+def build_jxe(path, args) -> None:
+    """Writes a synthetic JXE archive."""
+    rom = build_rom_classes(args)
+    with zipfile.ZipFile(path, "w") as jxe:
+        jxe.writestr(
+            zipfile.ZipInfo("rom.classes"),
+            rom,
+            compress_type=zipfile.ZIP_DEFLATED if args.deflate else zipfile.ZIP_STORED,
+        )
+        jxe.writestr("META-INF/MANIFEST.MF", "Manifest-Version: 1.0\r\n\r\n")
+        jxe.writestr(
+            "res/strings.properties",
+            "hello=world\n" * 64,
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+
+
+def make_parser() -> argparse.ArgumentParser:
+    """Returns generator argument parser."""
+    parser = argparse.ArgumentParser(description="Generates a synthetic JXE.")
+    parser.add_argument("output", help="output JXE file")
+    add_arguments(parser)
+    return parser
+
+
+def add_arguments(parser) -> None:
+    """Adds generator parameters to parser."""
+    group = parser.add_argument_group("synthetic image")
+    group.add_argument("--classes", type=int, default=100, help="class count")
+    group.add_argument("--methods", type=int, default=8, help="methods per class")
+    group.add_argument("--fields", type=int, default=4, help="fields per class")
+    group.add_argument("--strings", type=int, default=16, help="string constants")
+    group.add_argument("--class-refs", type=int, default=8, help="class constants")
+    group.add_argument("--refs", type=int, default=24, help="field/method refs")
+    group.add_argument("--ints", type=int, default=8, help="int constants")
+    group.add_argument("--longs", type=int, default=2, help="long constants")
+    group.add_argument(
+        "--switch-size", type=int, default=16, help="max switch table entries"
+    )
+    group.add_argument("--natives", action="store_true", help="add native methods")
+    group.add_argument("--major", type=int, default=46, help="class major version")
+    group.add_argument("--minor", type=int, default=0, help="class minor version")
+    group.add_argument(
+        "--deflate", action="store_true", help="deflate rom.classes member"
+    )
+    group.add_argument("--seed", type=int, default=0, help="random seed")
+
+
+if __name__ == "__main__":
+    _args = make_parser().parse_args()
+    build_jxe(_args.output, _args)
@@ -1,7 +1,10 @@
 """Java bytecode."""
+import re
 import struct
+from array import array
 from enum import Enum
-from bitstring import BitArray
+
+from common import logger
 from constpool import CONST
 
 
@@ -235,271 +238,400 @@ class JBOpcode(int, Enum):
     JBimpdep2 = 0xFF
 
 
+class OperandKind(int, Enum):
+    """Operand layout of a J9 opcode, selects its transform handler."""
+
+    NONE = 0  # single byte, copied (or translated) in bulk runs
+    BYTE = 1  # u8 operand, copied
+    IINC = 2  # u8 index, i8 const, copied
+    SHORT = 3  # u16 le operand, byte-swapped
+    IINCW = 4  # u16 le index, u16 le const, byte-swapped
+    INT = 5  # u32 le operand, byte-swapped
+    CP_INDEX = 6  # u16 le ROM cp index, remapped
+    LDC = 7  # u8 ROM cp index, remapped
+    LDC2LW = 8
+    LDC2DW = 9
+    MULTIANEWARRAY = 10  # u16 le ROM cp index, u8 dimensions
+    INVOKEINTERFACE2 = 11  # invokeinterface2 nop invokeinterface u16 le index
+    INVOKEINTERFACE = 12
+    TABLESWITCH = 13
+    LOOKUPSWITCH = 14
+
+
+# Instruction length including opcode, 0 for switches which depend on operands.
+# INVOKEINTERFACE2 covers the whole JBinvokeinterface2 JBnop JBinvokeinterface.
+# Handlers return i + length, bench/check_lengths.py checks them against it.
+KIND_LENGTHS = {
+    OperandKind.NONE: 1,
+    OperandKind.BYTE: 2,
+    OperandKind.IINC: 3,
+    OperandKind.SHORT: 3,
+    OperandKind.IINCW: 5,
+    OperandKind.INT: 5,
+    OperandKind.CP_INDEX: 3,
+    OperandKind.LDC: 2,
+    OperandKind.LDC2LW: 3,
+    OperandKind.LDC2DW: 3,
+    OperandKind.MULTIANEWARRAY: 4,
+    OperandKind.INVOKEINTERFACE2: 5,
+    OperandKind.INVOKEINTERFACE: 3,
+    OperandKind.TABLESWITCH: 0,
+    OperandKind.LOOKUPSWITCH: 0,
+}
+
+_U16LE = struct.Struct("<H")
+_U16BE = struct.Struct(">H")
+_I32LE = struct.Struct("<i")
+_I32LE2 = struct.Struct("<ii")
+# Tags of ConstPool.new_type
+_DOUBLE = CONST.DOUBLE[0]
+_INTEGER = CONST.INTEGER[0]
+
+
+def _switch_length(bytecode, i) -> int:
+    """Returns length of J9 tableswitch/lookupswitch at i."""
+    operands = i + 1 + (-(i + 1) % 4)
+    if bytecode[i] == JBOpcode.JBtableswitch:
+        low, high = _I32LE2.unpack_from(bytecode, operands + 4)
+        count = high - low + 1
+        length = operands - i + 12 + 4 * count
+    else:
+        count = _I32LE.unpack_from(bytecode, operands + 4)[0]
+        length = operands - i + 8 + 8 * count
+    if count < 0:
+        raise ValueError(f"Bad switch at {i}: {count} entries")
+    return length
+
+
+def _transform_byte(bytecode, i, new_bytecode, cp, cp_fixups):
+    new_bytecode += bytecode[i : i + 2]
+    return i + 2
+
+
+def _transform_iinc(bytecode, i, new_bytecode, cp, cp_fixups):
+    new_bytecode += bytecode[i : i + 3]
+    return i + 3
+
+
+def _transform_short(bytecode, i, new_bytecode, cp, cp_fixups):
+    new_bytecode += bytes((bytecode[i], bytecode[i + 2], bytecode[i + 1]))
+    return i + 3
+
+
+def _transform_iincw(bytecode, i, new_bytecode, cp, cp_fixups):
+    new_bytecode += bytes(
+        (
+            bytecode[i],
+            bytecode[i + 2],
+            bytecode[i + 1],
+            bytecode[i + 4],
+            bytecode[i + 3],
+        )
+    )
+    return i + 5
+
+
+def _transform_int(bytecode, i, new_bytecode, cp, cp_fixups):
+    new_bytecode.append(bytecode[i])
+    new_bytecode += bytecode[i + 4 : i : -1]
+    return i + 5
+
+
+def _transform_cp_index(bytecode, i, new_bytecode, cp, cp_fixups):
+    new_bytecode.append(bytecode[i])
+    new_index = cp.get_transform(_U16LE.unpack_from(bytecode, i + 1)[0])
+    new_bytecode += _U16BE.pack(new_index + 1)
+    return i + 3
+
+
+def _transform_ldc(bytecode, i, new_bytecode, cp, cp_fixups):
+    new_bytecode.append(bytecode[i])
+    new_bytecode.append(cp.get_transform(bytecode[i + 1]) + 1)
+    return i + 2
+
+
+def _transform_ldc2lw(bytecode, i, new_bytecode, cp, cp_fixups):
+    index = _U16LE.unpack_from(bytecode, i + 1)[0]
+    new_bytecode.append(JBOpcode.JBldc2lw)
+    # Slots with a type are always mapped, so new_index is read directly
+    const_type = cp.new_type[index] if index < len(cp.new_type) else 0
+    if const_type == _DOUBLE:
+        new_index = cp.new_index[index]
+        cp_fixups[new_index] = CONST.LONG
+    elif const_type == _INTEGER:
+        new_index = cp.new_index[index]
+        new_index = cp.add(CONST.LONG, (0, cp.get_int(new_index))) - 1
+    else:
+        logger.warning("ldc2_w fallback: ROM cp index %d", index)
+        # TODO: very dirty hack, because we incorrectly
+        # parse constant pool used in 1 case
+        new_index = 0
+    new_bytecode += _U16BE.pack(new_index + 1)
+    return i + 3
+
+
+def _transform_ldc2dw(bytecode, i, new_bytecode, cp, cp_fixups):
+    new_bytecode.append(JBOpcode.JBldc2lw)
+    new_index = cp.get_transform(_U16LE.unpack_from(bytecode, i + 1)[0])
+    cp_fixups[new_index] = CONST.DOUBLE
+    new_bytecode += _U16BE.pack(new_index + 1)
+    return i + 3
+
+
+def _transform_multianewarray(bytecode, i, new_bytecode, cp, cp_fixups):
+    _transform_cp_index(bytecode, i, new_bytecode, cp, cp_fixups)
+    new_bytecode.append(bytecode[i + 3])
+    return i + 4
+
+
+def _transform_invokeinterface2(bytecode, i, new_bytecode, cp, cp_fixups):
+    # JBinvokeinterface2 -> invokeinterface
+    # Usually placed as JBinvokeinterface2 JBnop JBinvokeinterface
+    # invokeinterface in Oracle get 4 bytes but j9 get 2
+    # JBinvokeinterface2 JBnop correlate with this to fix this misalign
+    new_bytecode.append(JBOpcode.JBinvokeinterface)
+    index = _U16LE.unpack_from(bytecode, i + 3)[0]
+    new_index = cp.get_transform(index)
+    cp_fixups[index] = CONST.INTERFACEMETHODREF
+    new_bytecode += _U16BE.pack(new_index + 1)
+    new_bytecode += b"\x00\x00"
+    return i + 5
+
+
+def _transform_invokeinterface(bytecode, i, new_bytecode, cp, cp_fixups):
+    raise NotImplementedError
+
+
+def _transform_switch(bytecode, i, new_bytecode, cp, cp_fixups):
+    # Aligned operands (default, low/high or count, jump table) are all i32,
+    # so the whole table is byte-swapped in one go
+    end = i + instruction_length(bytecode, i)
+    operands = i + 1 + (-(i + 1) % 4)
+    new_bytecode.append(bytecode[i])
+    new_bytecode += bytes(operands - i - 1)
+    table = array("i", bytecode[operands:end])
+    table.byteswap()
+    new_bytecode += table
+    return end
+
+
+_KIND_HANDLERS = {
+    OperandKind.NONE: None,
+    OperandKind.BYTE: _transform_byte,
+    OperandKind.IINC: _transform_iinc,
+    OperandKind.SHORT: _transform_short,
+    OperandKind.IINCW: _transform_iincw,
+    OperandKind.INT: _transform_int,
+    OperandKind.CP_INDEX: _transform_cp_index,
+    OperandKind.LDC: _transform_ldc,
+    OperandKind.LDC2LW: _transform_ldc2lw,
+    OperandKind.LDC2DW: _transform_ldc2dw,
+    OperandKind.MULTIANEWARRAY: _transform_multianewarray,
+    OperandKind.INVOKEINTERFACE2: _transform_invokeinterface2,
+    OperandKind.INVOKEINTERFACE: _transform_invokeinterface,
+    OperandKind.TABLESWITCH: _transform_switch,
+    OperandKind.LOOKUPSWITCH: _transform_switch,
+}
+
+
+def _build_dispatch_table():
+    """Returns 256-entry list of (operand kind, handler) by J9 opcode."""
+    kinds = [OperandKind.NONE] * 256
+    for kind, opcodes in (
+        (
+            OperandKind.BYTE,
+            (
+                JBOpcode.JBbipush,
+                JBOpcode.JBnewarray,
+                JBOpcode.JBiload,
+                JBOpcode.JBlload,
+                JBOpcode.JBfload,
+                JBOpcode.JBdload,
+                JBOpcode.JBaload,
+                JBOpcode.JBistore,
+                JBOpcode.JBlstore,
+                JBOpcode.JBfstore,
+                JBOpcode.JBdstore,
+                JBOpcode.JBastore,
+                JBOpcode.JBret,
+            ),
+        ),
+        (OperandKind.IINC, (JBOpcode.JBiinc,)),
+        (
+            OperandKind.SHORT,
+            (
+                JBOpcode.JBiloadw,
+                JBOpcode.JBlloadw,
+                JBOpcode.JBfloadw,
+                JBOpcode.JBdloadw,
+                JBOpcode.JBaloadw,
+                JBOpcode.JBistorew,
+                JBOpcode.JBlstorew,
+                JBOpcode.JBfstorew,
+                JBOpcode.JBdstorew,
+                JBOpcode.JBastorew,
+                JBOpcode.JBsipush,
+                JBOpcode.JBifeq,
+                JBOpcode.JBifne,
+                JBOpcode.JBiflt,
+                JBOpcode.JBifge,
+                JBOpcode.JBifgt,
+                JBOpcode.JBifle,
+                JBOpcode.JBificmpeq,
+                JBOpcode.JBificmpne,
+                JBOpcode.JBificmplt,
+                JBOpcode.JBificmpge,
+                JBOpcode.JBificmpgt,
+                JBOpcode.JBificmple,
+                JBOpcode.JBifacmpeq,
+                JBOpcode.JBifacmpne,
+                JBOpcode.JBgoto,
+                JBOpcode.JBjsr,
+                JBOpcode.JBifnull,
+                JBOpcode.JBifnonnull,
+            ),
+        ),
+        (OperandKind.IINCW, (JBOpcode.JBiincw,)),
+        (OperandKind.INT, (JBOpcode.JBgotow,)),
+        (
+            OperandKind.CP_INDEX,
+            (
+                JBOpcode.JBgetstatic,
+                JBOpcode.JBputstatic,
+                JBOpcode.JBgetfield,
+                JBOpcode.JBputfield,
+                JBOpcode.JBinvokevirtual,
+                JBOpcode.JBinvokespecial,
+                JBOpcode.JBinvokestatic,
+                JBOpcode.JBnew,
+                JBOpcode.JBanewarray,
+                JBOpcode.JBcheckcast,
+                JBOpcode.JBinstanceof,
+                JBOpcode.JBldcw,
+            ),
+        ),
+        (OperandKind.LDC, (JBOpcode.JBldc,)),
+        (OperandKind.LDC2LW, (JBOpcode.JBldc2lw,)),
+        (OperandKind.LDC2DW, (JBOpcode.JBldc2dw,)),
+        (OperandKind.MULTIANEWARRAY, (JBOpcode.JBmultianewarray,)),
+        (OperandKind.INVOKEINTERFACE2, (JBOpcode.JBinvokeinterface2,)),
+        (OperandKind.INVOKEINTERFACE, (JBOpcode.JBinvokeinterface,)),
+        (OperandKind.TABLESWITCH, (JBOpcode.JBtableswitch,)),
+        (OperandKind.LOOKUPSWITCH, (JBOpcode.JBlookupswitch,)),
+    ):
+        for opcode in opcodes:
+            kinds[opcode] = kind
+    return [(kind, _KIND_HANDLERS[kind]) for kind in kinds]
+
+
+DISPATCH_TABLE = _build_dispatch_table()
+_HANDLERS = [handler for _, handler in DISPATCH_TABLE]
+OPCODE_LENGTHS = bytes(KIND_LENGTHS[kind] for kind, _ in DISPATCH_TABLE)
+
+# Finds next opcode which isn't a single byte one, runs before it are copied
+_MULTIBYTE_OPCODE = re.compile(
+    b"["
+    + b"".join(
+        re.escape(bytes((opcode,)))
+        for opcode, (kind, _) in enumerate(DISPATCH_TABLE)
+        if kind != OperandKind.NONE
+    )
+    + b"]"
+)
+
+
+def instruction_length(bytecode, i) -> int:
+    """Returns length of J9 instruction at i, including its operands."""
+    return OPCODE_LENGTHS[bytecode[i]] or _switch_length(bytecode, i)
+
+
+def scan_instructions(bytecode) -> array:
+    """Returns offsets of all J9 instructions of method bytecode.
+
+    Runs of single byte opcodes are added at once, raises ValueError if last
+    instruction runs past the end.
+    """
+    offsets = array("I")
+    i = 0
+    end = len(bytecode)
+    search = _MULTIBYTE_OPCODE.search
+    while i < end:
+        match = search(bytecode, i)
+        run_end = match.start() if match else end
+        offsets.extend(range(i, run_end))
+        if run_end == end:
+            return offsets
+        offsets.append(run_end)
+        i = run_end + instruction_length(bytecode, run_end)
+    if i != end:
+        raise ValueError(f"Instruction at {offsets[-1]} runs past end of bytecode")
+    return offsets
+
+
+def _build_translation(return1, return2):
+    """Returns translation table rewriting single byte J9 opcodes."""
+    table = bytearray(range(256))
+    table[JBOpcode.JBaload0getfield] = JBOpcode.JBaload0
+    # JBreturn0 -> return (0xb1)
+    # Used only if function return void
+    for opcode in (
+        JBOpcode.JBreturn0,
+        JBOpcode.JBsyncReturn0,
+        JBOpcode.JBreturnFromConstructor,
+    ):
+        table[opcode] = 0xB1
+    # JBreturn1 -> areturn/ireturn/freturn, used only after push on stack
+    table[JBOpcode.JBreturn1] = table[JBOpcode.JBsyncReturn1] = return1
+    # JBreturn2 -> lreturn/dreturn, used only after push on stack
+    table[JBOpcode.JBreturn2] = table[JBOpcode.JBsyncReturn2] = return2
+    return bytes(table)
+
+
+_TRANSLATIONS = {
+    (return1, return2): _build_translation(return1, return2)
+    for return1 in (0xAC, 0xAE, 0xB0)
+    for return2 in (0xAD, 0xAF)
+}
+
+
+def _get_translation(signature):
+    """Returns single byte opcode translation for method signature."""
+    return_type = signature[signature.rfind(")") + 1 :]
+    if return_type in ("B", "Z", "S", "C", "I"):
+        return1 = 0xAC
+    elif return_type == "F":
+        return1 = 0xAE
+    else:
+        return1 = 0xB0
+    return2 = 0xAF if return_type == "D" else 0xAD
+    return _TRANSLATIONS[(return1, return2)]
+
+
 def transform_bytecode(bytecode, signature, cp):
     """Transforms bytecode"""
     i = 0
-    new_cp_transform = {}
+    end = len(bytecode)
+    cp_fixups = {}
     new_bytecode = bytearray()
+    translation = _get_translation(signature)
+    handlers = _HANDLERS
+    search = _MULTIBYTE_OPCODE.search
+
+    while i < end:
+        match = search(bytecode, i)
+        run_end = match.start() if match else end
+        if run_end > i:
+            new_bytecode += bytecode[i:run_end].translate(translation)
+            i = run_end
+            if i == end:
+                break
+        i = handlers[bytecode[i]](bytecode, i, new_bytecode, cp, cp_fixups)
+
+    if i != end:
+        # Handlers advance by OPCODE_LENGTHS, so header size was inconsistent
+        raise ValueError(f"Last instruction runs {i - end} bytes past bytecode end")
 
-    while i < len(bytecode):
-        opcode = bytecode[i]
-        if opcode in (
-            JBOpcode.JBgetstatic,
-            JBOpcode.JBputstatic,
-            JBOpcode.JBgetfield,
-            JBOpcode.JBputfield,
-            JBOpcode.JBinvokevirtual,
-            JBOpcode.JBinvokespecial,
-            JBOpcode.JBinvokestatic,
-            JBOpcode.JBnew,
-            JBOpcode.JBanewarray,
-            JBOpcode.JBcheckcast,
-            JBOpcode.JBinstanceof,
-        ):
-            new_bytecode.append(opcode)
-            index = struct.unpack("<H", bytecode[i + 1 : i + 3])[0]
-            transform = cp.get_transform(index)
-            new_index = transform["new_index"]
-            tmp = struct.pack(">H", new_index + 1)
-            new_bytecode += tmp
-            i += 3
-        elif opcode in (JBOpcode.JBldcw,):
-            new_bytecode.append(opcode)
-            index = struct.unpack("<H", bytecode[i + 1 : i + 3])[0]
-            transform = cp.get_transform(index)
-            new_index = transform["new_index"]
-            tmp = struct.pack(">H", new_index + 1)
-            new_bytecode += tmp
-            i += 3
-        elif opcode in (JBOpcode.JBldc2lw,):
-            index = struct.unpack("<H", bytecode[i + 1 : i + 3])[0]
-            new_bytecode.append(JBOpcode.JBldc2lw)
-            if cp.check_transform(index, b"\x06"):
-                transform = cp.get_transform(index)
-                new_index = transform["new_index"]
-                tmp = struct.pack(">H", new_index + 1)
-                new_cp_transform[new_index] = b"\x05"
-                new_bytecode += tmp
-            else:
-                if cp.check_transform(index, b"\x03"):
-                    transform = cp.get_transform(index)
-                    new_index = transform["new_index"]
-                    new_index = cp.add(CONST.LONG, (0, cp.get_int(new_index))) - 1
-                else:
-                    print("WARNING: ldc2_w fallback")
-                    # TODO: very dirty hack, because we incorrectly
-                    # parse constant pool used in 1 case
-                    new_index = 0
-                tmp = struct.pack(">H", new_index + 1)
-                new_bytecode += tmp
-            i += 3
-        elif opcode in (JBOpcode.JBldc2dw,):
-            new_bytecode.append(JBOpcode.JBldc2lw)
-            index = struct.unpack("<H", bytecode[i + 1 : i + 3])[0]
-            transform = cp.get_transform(index)
-            new_index = transform["new_index"]
-            tmp = struct.pack(">H", new_index + 1)
-            new_cp_transform[new_index] = b"\x06"
-            new_bytecode += tmp
-            i += 3
-        elif opcode in (JBOpcode.JBiincw,):
-            new_bytecode.append(JBOpcode.JBiincw)
-            o1 = struct.unpack("<H", bytecode[i + 1 : i + 3])[0]
-            o2 = struct.unpack("<H", bytecode[i + 3 : i + 5])[0]
-            t1 = struct.pack(">H", o1)
-            t2 = struct.pack(">H", o2)
-            new_bytecode += t1 + t2
-            i += 5
-        elif opcode in (
-            JBOpcode.JBiloadw,
-            JBOpcode.JBlloadw,
-            JBOpcode.JBfloadw,
-            JBOpcode.JBdloadw,
-            JBOpcode.JBaloadw,
-            JBOpcode.JBistorew,
-            JBOpcode.JBlstorew,
-            JBOpcode.JBfstorew,
-            JBOpcode.JBdstorew,
-            JBOpcode.JBastorew,
-        ):
-            new_bytecode.append(opcode)
-            value = struct.unpack("<H", bytecode[i + 1 : i + 3])[0]
-            tmp = struct.pack(">H", value)
-            new_bytecode += tmp
-            i += 3
-        elif opcode in (
-            JBOpcode.JBsipush,
-            JBOpcode.JBifeq,
-            JBOpcode.JBifne,
-            JBOpcode.JBiflt,
-            JBOpcode.JBifge,
-            JBOpcode.JBifgt,
-            JBOpcode.JBifle,
-            JBOpcode.JBificmpeq,
-            JBOpcode.JBificmpne,
-            JBOpcode.JBificmplt,
-            JBOpcode.JBificmpge,
-            JBOpcode.JBificmpgt,
-            JBOpcode.JBificmple,
-            JBOpcode.JBifacmpeq,
-            JBOpcode.JBifacmpne,
-            JBOpcode.JBgoto,
-            JBOpcode.JBjsr,
-            JBOpcode.JBifnull,
-            JBOpcode.JBifnonnull,
-        ):
-            new_bytecode.append(opcode)
-            index = struct.unpack("<H", bytecode[i + 1 : i + 3])[0]
-            tmp = struct.pack(">H", index)
-            new_bytecode += tmp
-            i += 3
-        elif opcode in (JBOpcode.JBaload0getfield,):
-            new_bytecode.append(JBOpcode.JBaload0)
-            i += 1
-        elif opcode in (JBOpcode.JBreturn0, JBOpcode.JBsyncReturn0, JBOpcode.JBreturnFromConstructor):
-            # JBreturn0 -> return (0xb1)
-            # Used only if function return void
-            new_bytecode.append(0xB1)
-            i += 1
-        elif opcode in (JBOpcode.JBreturn1, JBOpcode.JBsyncReturn1):
-            # JBreturn1 -> areturn/ireturn/freturn (0xb0)
-            # Used only after push on stack
-            if signature.endswith(")B") or signature.endswith(")Z") or signature.endswith(")S") or \
-                signature.endswith(")C") or signature.endswith(")I"):
-                new_bytecode.append(0xAC)
-            elif signature.endswith(")F"):
-                new_bytecode.append(0xAE)
-            else:
-                new_bytecode.append(0xB0)
-            i += 1
-        elif opcode in (JBOpcode.JBreturn2, JBOpcode.JBsyncReturn2):
-            # JBreturn2 -> lreturn/dreturn
-            # Used only after push on stack
-            if signature.endswith(")J"):
-                new_bytecode.append(0xAD)
-            elif signature.endswith(")D"):
-                new_bytecode.append(0xAF)
-            else:
-                new_bytecode.append(0xAD)
-            i += 1
-        elif opcode in (JBOpcode.JBinvokeinterface2,):
-            # JBinvokeinterface2 -> invokeinterface
-            # Usually placed as JBinvokeinterface2 JBnop JBinvokeinterface
-            # invokeinterface in Oracle get 4 bytes but j9 get 2
-            # JBinvokeinterface2 JBnop correlate with this to fix this misalign
-            new_bytecode.append(JBOpcode.JBinvokeinterface)
-            index = struct.unpack("<H", bytecode[i + 3 : i + 5])[0]
-            transform = cp.get_transform(index)
-            new_index = transform["new_index"]
-            tmp = struct.pack(">H", new_index + 1)
-            new_cp_transform[index] = b"\x0b"
-            new_bytecode += tmp
-            new_bytecode.append(0)
-            new_bytecode.append(0)
-            i += 5
-        elif opcode in (JBOpcode.JBinvokeinterface,):
-            raise NotImplementedError
-        elif opcode in (JBOpcode.JBldc,):
-            new_bytecode.append(opcode)
-            index = bytecode[i + 1]
-            transform = cp.get_transform(index)
-            new_index = transform["new_index"]
-            new_bytecode.append(new_index + 1)
-            i += 2
-        elif opcode in (
-            JBOpcode.JBbipush,
-            JBOpcode.JBnewarray,
-            JBOpcode.JBiload,
-            JBOpcode.JBlload,
-            JBOpcode.JBfload,
-            JBOpcode.JBdload,
-            JBOpcode.JBaload,
-            JBOpcode.JBistore,
-            JBOpcode.JBlstore,
-            JBOpcode.JBfstore,
-            JBOpcode.JBdstore,
-            JBOpcode.JBastore,
-            JBOpcode.JBret,
-        ):
-            new_bytecode.append(opcode)
-            new_bytecode.append(bytecode[i + 1])
-            i += 2
-        elif opcode in (JBOpcode.JBiinc,):
-            new_bytecode.append(opcode)
-            new_bytecode.append(bytecode[i + 1])
-            new_bytecode.append(bytecode[i + 2])
-            i += 3
-        elif opcode in (JBOpcode.JBtableswitch,):
-            new_bytecode.append(opcode)
-            padding = (i + 1) % 4
-            padding = padding if padding == 0 else (4 - padding)
-            for _ in range(padding):
-                new_bytecode.append(0x0)
-            i += padding + 1
-            default = struct.unpack("<I", bytecode[i : i + 4])[0]
-            tmp = struct.pack(">I", default)
-            new_bytecode += tmp
-            i += 4
-            low = struct.unpack("<i", bytecode[i : i + 4])[0]
-            tmp = struct.pack(">i", low)
-            new_bytecode += tmp
-            i += 4
-            high = struct.unpack("<i", bytecode[i : i + 4])[0]
-            tmp = struct.pack(">i", high)
-            new_bytecode += tmp
-            try:
-                for _ in range(high - low + 1):
-                    i += 4
-                    left = struct.unpack("<I", bytecode[i : i + 4])[0]
-                    tmp = struct.pack(">I", left)
-                    new_bytecode += tmp
-            except OverflowError as err:
-                raise err
-            i += 4
-        elif opcode in (JBOpcode.JBlookupswitch,):
-            new_bytecode.append(opcode)
-            padding = (i + 1) % 4
-            padding = padding if padding == 0 else (4 - padding)
-            for _ in range(padding):
-                new_bytecode.append(0x0)
-            i += padding + 1
-            default = struct.unpack("<I", bytecode[i : i + 4])[0]
-            tmp = struct.pack(">I", default)
-            new_bytecode += tmp
-            i += 4
-            n = struct.unpack("<I", bytecode[i : i + 4])[0]
-            tmp = struct.pack(">I", n)
-            new_bytecode += tmp
-            for _ in range(n):
-                i += 4
-                left = struct.unpack("<I", bytecode[i : i + 4])[0]
-                tmp = struct.pack(">I", left)
-                new_bytecode += tmp
-                i += 4
-                right = struct.unpack("<I", bytecode[i : i + 4])[0]
-                tmp = struct.pack(">I", right)
-                new_bytecode += tmp
-            i += 4
-        elif opcode in (JBOpcode.JBmultianewarray,):
-            new_bytecode.append(opcode)
-            index = struct.unpack("<H", bytecode[i + 1 : i + 3])[0]
-            transform = cp.get_transform(index)
-            new_index = transform["new_index"]
-            tmp = struct.pack(">H", new_index + 1)
-            new_bytecode += tmp
-            new_bytecode.append(bytecode[i + 3])
-            i += 4
-        elif opcode in (JBOpcode.JBgotow,):
-            new_bytecode.append(opcode)
-            value = struct.unpack("<I", bytecode[i + 1 : i + 5])[0]
-            tmp = struct.pack(">I", value)
-            new_bytecode += tmp
-            i += 5
-        else:
-            new_bytecode.append(opcode)
-            i += 1
-
-    for index, value in new_cp_transform.items():
+    for index, value in cp_fixups.items():
         cp.apply_transform(index, value)
 
     return new_bytecode
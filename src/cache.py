@@ -0,0 +1,87 @@
+"""Conversion cache class."""
+import hashlib
+import os
+import os.path
+import tempfile
+
+import common
+
+# Modules whose code shapes class file bytes, jxe2jar holds dump_romclass.
+# Read by path, jxe2jar imports this module and may run as __main__.
+SOURCES = ("common", "jxe", "constpool", "bytecode", "jxe2jar")
+
+
+def converter_version() -> str:
+    """Returns hash of converter sources, so any change invalidates cache."""
+    digest = hashlib.sha256()
+    for name in SOURCES:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{name}.py")
+        with open(path, "rb") as fp_source:
+            digest.update(fp_source.read())
+    return digest.hexdigest()[:16]
+
+
+def class_key(classes, index, version) -> str:
+    """Returns key of class (name, crc, rom bytes hash, converter version)."""
+    class_name, rom_size, crc = classes.header(index)
+    rom_hash = hashlib.blake2b(classes.rom_bytes(index, rom_size)).hexdigest()
+    digest = hashlib.sha256(
+        f"{class_name}\0{crc:08x}\0{rom_hash}\0{version}".encode("utf-8")
+    )
+    return digest.hexdigest()
+
+
+def class_keys(classes, indexes, version) -> dict:
+    """Returns TOC index -> key of classes, leaving out classes failing to hash.
+
+    A class without key is converted rather than cached or copied.
+    """
+    keys = {}
+    for index in indexes:
+        try:
+            keys[index] = class_key(classes, index, version)
+        except Exception as exc:  # pylint: disable=W0718
+            common.logger.warning(
+                "bad class key, convert: %s: %r", classes.names[index], exc
+            )
+    return keys
+
+
+class ClassCache:
+    """On-disk cache of converted class files keyed by ROM class content."""
+
+    def __init__(self, path: str, version: str = None):
+        self.path = path
+        self.version = version or converter_version()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.class")
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str) -> bytes:
+        """Returns cached class bytes or None."""
+        try:
+            with open(self._path(key), "rb") as fp_class:
+                data = fp_class.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Stores class bytes, concurrent writers never expose partial files."""
+        path = self._path(key)
+        common.create_file_path(path)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp_class:
+                fp_class.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
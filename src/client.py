@@ -0,0 +1,104 @@
+"""Conversion client.
+
+Thin client of server.py, imports no converter modules so it starts fast.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+
+def request(socket_path: str, message: dict, payload=None) -> tuple[dict, bytes]:
+    """Sends request to server, returns (response, JAR bytes or None)."""
+    if payload is not None:
+        message["payload_size"] = len(payload)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as fp_sock:
+            fp_sock.write(json.dumps(message).encode("utf-8") + b"\n")
+            if payload is not None:
+                fp_sock.write(payload)
+            fp_sock.flush()
+            response = json.loads(fp_sock.readline())
+            jar = None
+            if response.get("jar_size") is not None:
+                jar = fp_sock.read(response["jar_size"])
+                if len(jar) != response["jar_size"]:
+                    raise EOFError("Server closed connection before end of JAR")
+    return response, jar
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Converts JXE to JAR file on a running server.",
+        usage="%(prog)s [options] socket jxe jar\n"
+        "       %(prog)s socket --status|--stop",
+    )
+    parser.add_argument("socket", help="Unix socket of server.py")
+    parser.add_argument("jxe", nargs="?", help="input JXE file")
+    parser.add_argument("jar", nargs="?", help="output JAR file")
+    parser.add_argument(
+        "--status", action="store_true", help="print server status and exit"
+    )
+    parser.add_argument("--stop", action="store_true", help="stop server and exit")
+    parser.add_argument(
+        "--send",
+        action="store_true",
+        help="send JXE contents and receive JAR instead of passing paths",
+    )
+    parser.add_argument("--compress", choices=("store", "deflate"), default="store")
+    parser.add_argument("--level", type=int, choices=range(10), default=6)
+    parser.add_argument("--include", action="append", metavar="GLOB")
+    parser.add_argument("--exclude", action="append", metavar="GLOB")
+    parser.add_argument("--incremental", metavar="JAR")
+    parser.add_argument("--no-resources", dest="resources", action="store_false")
+    parser.add_argument("--manifest", action="store_true")
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="don't print warning summary"
+    )
+    # Intermixed, so options may also sit between socket and paths
+    args = parser.parse_intermixed_args(argv)
+    if not (args.status or args.stop) and (args.jxe is None or args.jar is None):
+        parser.error("expected jxe and jar")
+    return args
+
+
+def _main():
+    args = _parse_args()
+    if args.status or args.stop:
+        command = "stop" if args.stop else "status"
+        response, _ = request(args.socket, {"command": command})
+        print(json.dumps(response, indent=2))
+        return
+    message = {
+        "command": "convert",
+        "compression": args.compress,
+        "level": args.level,
+        "include": args.include,
+        "exclude": args.exclude,
+        "incremental": args.incremental and os.path.abspath(args.incremental),
+        "resources": args.resources,
+        "manifest": args.manifest,
+    }
+    payload = None
+    if args.send:
+        with open(args.jxe, "rb") as fp_jxe:
+            payload = fp_jxe.read()
+    else:
+        # Server resolves paths from its own working directory
+        message["jxe"] = os.path.abspath(args.jxe)
+        message["jar"] = os.path.abspath(args.jar)
+    response, jar = request(args.socket, message, payload)
+    if not response.get("ok"):
+        print(f"ERROR: {response.get('error')}", file=sys.stderr)
+        sys.exit(1)
+    if jar is not None:
+        with open(args.jar, "wb") as fp_jar:
+            fp_jar.write(jar)
+    if response.get("warnings") and not args.quiet:
+        print(response["warnings"], file=sys.stderr)
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,10 +1,21 @@
 """Common class."""
 import errno
+import logging
+import mmap
 import os
 import os.path
-from io import IOBase
+import struct
+import sys
+from collections import Counter
+from io import SEEK_CUR, SEEK_END, SEEK_SET, IOBase, RawIOBase
+from zipfile import BadZipFile
 
-import bitstring
+try:
+    import bitstring
+except ImportError:  # bitstring is only needed by the fallback reader
+    bitstring = None
+
+logger = logging.getLogger("jxe2jar")
 
 
 class StreamCursor:
@@ -25,10 +36,212 @@ class StreamCursor:
         self._stream_.set(self._old_pos_)
 
 
+class BufferReader(RawIOBase):
+    """Seekable read-only binary file over a buffer, without copying it."""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._data_ = memoryview(buffer).cast("B")
+        self._pos_ = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        """Reads bytes into buffer, returns their count."""
+        data = self._data_[self._pos_ : self._pos_ + len(buffer)]
+        length = len(data)
+        memoryview(buffer).cast("B")[:length] = data
+        self._pos_ += length
+        return length
+
+    def seek(self, pos: int, whence: int = SEEK_SET) -> int:
+        """Sets position relative to whence, returns new position."""
+        if whence == SEEK_CUR:
+            pos += self._pos_
+        elif whence == SEEK_END:
+            pos += len(self._data_)
+        elif whence != SEEK_SET:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            # Same as files, zipfile probes for the end record expecting OSError
+            raise OSError(errno.EINVAL, f"Negative seek position: {pos}")
+        self._pos_ = pos
+        return pos
+
+    def tell(self) -> int:
+        """Returns current position."""
+        return self._pos_
+
+
 class ReaderStream:
-    """ReaderStream class."""
+    """ReaderStream class using memoryview and precompiled structs."""
+
+    _U8_ = struct.Struct("<B")
+    _U16_ = struct.Struct("<H")
+    _U32_ = struct.Struct("<I")
+    _I8_ = struct.Struct("<b")
+    _I16_ = struct.Struct("<h")
+    _I32_ = struct.Struct("<i")
+
+    def __init__(self, obj, use_mmap: bool = True):
+        self._file_object_ = None
+        if isinstance(obj, IOBase):
+            self._file_object_ = obj
+            data = self._map_file_(obj) if use_mmap else None
+            if data is None:
+                obj.seek(0)
+                data = obj.read()
+                obj.seek(0)
+        elif bitstring is not None and isinstance(obj, bitstring.Bits):
+            data = obj.tobytes()
+        else:
+            data = obj
+        try:
+            self._data_ = memoryview(data).cast("B")
+        except TypeError as exc:
+            raise TypeError("Invalid ReaderStream instance type") from exc
+        self._pos_ = 0
+        self._strings_ = {}
+
+    @staticmethod
+    def _map_file_(file_object):
+        """Returns read-only mapping of file object or None if not mappable."""
+        try:
+            return mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # In-memory file objects have no fileno and empty files can't be mapped
+            return None
+
+    def _unpack_(self, fmt: struct.Struct):
+        pos = self._pos_
+        try:
+            (value,) = fmt.unpack_from(self._data_, pos)
+        except struct.error as exc:
+            raise EOFError from exc
+        self._pos_ = pos + fmt.size
+        return value
+
+    def get(self) -> int:
+        """Returns current file stream cursor position."""
+        return self._pos_
+
+    def set(self, pos: int) -> None:
+        """Sets current file stream cursor position."""
+        if pos < 0 or pos > len(self._data_):
+            raise EOFError
+        self._pos_ = pos
+
+    def read_bytes(self, length: int):
+        """Reads n bytes from file stream."""
+        pos = self._pos_
+        end = pos + length
+        if length < 0 or end > len(self._data_):
+            raise EOFError
+        self._pos_ = end
+        return self._data_[pos:end].tobytes()
+
+    def read_u8(self) -> int:
+        """Reads uint8 le from file stream."""
+        return self._unpack_(self._U8_)
+
+    def read_u16(self) -> int:
+        """Reads uint16 le from file stream."""
+        return self._unpack_(self._U16_)
+
+    def read_u32(self) -> int:
+        """Reads uint32 le from file stream."""
+        return self._unpack_(self._U32_)
+
+    def read_i8(self) -> int:
+        """Reads int8 le from file stream."""
+        return self._unpack_(self._I8_)
+
+    def read_i16(self) -> int:
+        """Reads int16 le from file stream."""
+        return self._unpack_(self._I16_)
+
+    def read_i32(self) -> int:
+        """Reads int32 le from file stream."""
+        return self._unpack_(self._I32_)
+
+    def read_string(self) -> str:
+        """Reads string (u16) from file stream as utf-8."""
+        length = self.read_u16()
+        pos = self._pos_
+        end = pos + length
+        if end > len(self._data_):
+            raise EOFError
+        self._pos_ = end
+        return str(self._data_[pos:end], "utf-8")
+
+    def read_relative(self):
+        """Reads int32 from file stream using relative position."""
+        base = self._pos_
+        return base + self._unpack_(self._I32_)
+
+    def read_string_at(self, ptr: int) -> str:
+        """Reads string at absolute position, decoded once per offset."""
+        value = self._strings_.get(ptr)
+        if value is None:
+            pos = self._pos_
+            self.set(ptr)
+            try:
+                value = self._strings_[ptr] = sys.intern(self.read_string())
+            finally:
+                self._pos_ = pos
+        return value
+
+    def read_string_ref(self) -> str:
+        """Reads string ref from file stream."""
+        return self.read_string_at(self.read_relative())
+
+    @property
+    def bytes(self) -> bytes:
+        """Returns bytes from stream buffer."""
+        return self._data_.tobytes()
+
+    @property
+    def len(self) -> int:
+        """Returns stream buffer length"""
+        return len(self._data_)
+
+    @property
+    def file_object(self) -> IOBase:
+        """Retursn file object."""
+        return self._file_object_
+
+    def sub_stream(self, offset: int, length: int):
+        """Returns stream over a slice of this stream without copying."""
+        return type(self)(self.view(offset, length))
+
+    def view(self, offset: int, length: int) -> memoryview:
+        """Returns memoryview of stream bytes without copying."""
+        if offset < 0 or length < 0 or offset + length > len(self._data_):
+            raise EOFError
+        return self._data_[offset : offset + length]
+
+    @property
+    def buffer(self) -> memoryview:
+        """Returns memoryview of whole stream without copying."""
+        return self._data_
+
+    @classmethod
+    def bytes_to_stream(cls, value: bytes):
+        """Returns ReaderStream from bytes."""
+        return cls(value)
+
+
+class BitReaderStream:
+    """ReaderStream class using bitstring (optional fallback backend)."""
 
     def __init__(self, obj):
+        if bitstring is None:
+            raise ImportError("bitstring is required for BitReaderStream")
+        self._file_object_ = None
         if isinstance(obj, IOBase):
             self._file_object_ = obj
             self._bit_stream_ = bitstring.BitStream(self._file_object_)
@@ -37,6 +250,8 @@ class ReaderStream:
             self._bit_stream_._append(obj)
         else:
             raise TypeError("Invalid ReaderStream instance type")
+        self._strings_ = {}
+        self._buffer_ = None
 
     def get(self) -> int:
         """Returns current file stream cursor position."""
@@ -85,15 +300,21 @@ class ReaderStream:
         ptr = self.read_i32()
         return base + ptr
 
+    def read_string_at(self, ptr: int) -> str:
+        """Reads string at absolute position, decoded once per offset."""
+        value = self._strings_.get(ptr)
+        if value is None:
+            pos = self.get()
+            self.set(ptr)
+            try:
+                value = self._strings_[ptr] = sys.intern(self.read_string())
+            finally:
+                self.set(pos)
+        return value
+
     def read_string_ref(self) -> str:
         """Reads string ref from file stream."""
-        ptr = self.read_relative()
-        pos = self.get()
-        self.set(ptr)
-        # print('%d %d' % (pos, ptr))
-        value = self.read_string()
-        self.set(pos)
-        return value
+        return self.read_string_at(self.read_relative())
 
     @property
     def bytes(self) -> bytes:
@@ -103,57 +324,148 @@ class ReaderStream:
     @property
     def len(self) -> int:
         """Returns BitArray length"""
-        return self._bit_stream_.length / 8
+        return self._bit_stream_.length // 8
 
     @property
     def file_object(self) -> IOBase:
         """Retursn file object."""
         return self._file_object_
 
+    def sub_stream(self, offset: int, length: int):
+        """Returns stream over a slice of this stream."""
+        return BitReaderStream(self._bit_stream_[offset * 8 : (offset + length) * 8])
+
+    def view(self, offset: int, length: int) -> bytes:
+        """Returns stream bytes."""
+        return self._bit_stream_[offset * 8 : (offset + length) * 8].bytes
+
+    @property
+    def buffer(self) -> bytes:
+        """Returns stream bytes, copied once and kept for later calls."""
+        if self._buffer_ is None:
+            self._buffer_ = self._bit_stream_.bytes
+        return self._buffer_
+
     @staticmethod
     def bytes_to_stream(value: bytes):
-        """Returns ReaderStream from bytes."""
-        return ReaderStream(bitstring.BitArray(bytes=value))
+        """Returns BitReaderStream from bytes."""
+        return BitReaderStream(bitstring.BitArray(bytes=value))
 
 
 class WriterStream:
-    """WriteStream class using bitstring."""
+    """WriterStream class accumulating into a single bytearray."""
+
+    _U8_ = struct.Struct(">B")
+    _U16_ = struct.Struct(">H")
+    _U32_ = struct.Struct(">I")
+    _I8_ = struct.Struct(">b")
+    _I16_ = struct.Struct(">h")
+    _I32_ = struct.Struct(">i")
 
-    def __init__(self, file_object):
+    def __init__(self, file_object=None, size_hint: int = 0x1000):
         self._file_object_ = file_object
-        self._bit_stream_ = bitstring.BitStream()
+        self._buffer_ = bytearray(size_hint)
+        self._pos_ = 0
+
+    def _reserve_(self, length: int) -> int:
+        """Reserves length bytes in buffer and returns their offset."""
+        pos = self._pos_
+        end = pos + length
+        size = len(self._buffer_)
+        if end > size:
+            self._buffer_ += bytes(max(end, size * 2) - size)
+        self._pos_ = end
+        return pos
+
+    def tell(self) -> int:
+        """Returns count of bytes written."""
+        return self._pos_
+
+    def getvalue(self) -> bytearray:
+        """Returns written bytes without copying the buffer."""
+        del self._buffer_[self._pos_ :]
+        return self._buffer_
 
     def write(self) -> None:
-        """Writes BitStream to file object."""
-        self._bit_stream_.tofile(self._file_object_)
+        """Writes buffer to file object."""
+        self._file_object_.write(self.getvalue())
 
     def write_raw_bytes(self, data: bytes) -> None:
-        """Writes raw bytes to BitArray stream."""
-        self._bit_stream_.append(bitstring.BitArray(bytes=data))
+        """Writes raw bytes to buffer."""
+        pos = self._reserve_(len(data))
+        self._buffer_[pos : self._pos_] = data
 
     def write_u8(self, value: int) -> None:
-        """Writes uint8 be to BitArray stream."""
-        self._bit_stream_.append(bitstring.pack("uintbe:8", value))
+        """Writes uint8 be to buffer."""
+        self._U8_.pack_into(self._buffer_, self._reserve_(1), value)
 
     def write_u16(self, value: int) -> None:
-        """Writes uint16 be to BitArray stream."""
-        self._bit_stream_.append(bitstring.pack("uintbe:16", value))
+        """Writes uint16 be to buffer."""
+        self._U16_.pack_into(self._buffer_, self._reserve_(2), value)
 
     def write_u32(self, value: int) -> None:
-        """Writes uint32 be to BitArray stream."""
-        self._bit_stream_.append(bitstring.pack("uintbe:32", value))
+        """Writes uint32 be to buffer."""
+        self._U32_.pack_into(self._buffer_, self._reserve_(4), value)
 
     def write_i8(self, value: int) -> None:
-        """Writes int8 be to BitArray stream."""
-        self._bit_stream_.append(bitstring.pack("intbe:8", value))
+        """Writes int8 be to buffer."""
+        self._I8_.pack_into(self._buffer_, self._reserve_(1), value)
 
     def write_i16(self, value: int) -> None:
-        """Writes int16 be to BitArray stream."""
-        self._bit_stream_.append(bitstring.pack("intbe:16", value))
+        """Writes int16 be to buffer."""
+        self._I16_.pack_into(self._buffer_, self._reserve_(2), value)
 
     def write_i32(self, value: int) -> None:
-        """Writes int32 be to BitArray stream."""
-        self._bit_stream_.append(bitstring.pack("intbe:32", value))
+        """Writes int32 be to buffer."""
+        self._I32_.pack_into(self._buffer_, self._reserve_(4), value)
+
+
+class WarningCounter(logging.Handler):
+    """Counts warnings by message prefix (text before ':') for run summary."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.counts = Counter()
+
+    def emit(self, record):
+        self.counts[str(record.msg).split(":", 1)[0]] += 1
+
+    def summary(self) -> str:
+        """Returns compact one line summary of counted warnings."""
+        total = sum(self.counts.values())
+        items = ", ".join(f"{msg} x{count}" for msg, count in self.counts.most_common())
+        return f"{total} warning(s): {items}" if total else ""
+
+
+def setup_logging(verbosity: int = 0) -> WarningCounter:
+    """Configures console logging by verbosity, returns warning counter.
+
+    verbosity < 0 shows errors only, 0 warnings, 1 info, 2 and more debug.
+    Warnings are always counted, even when they are not shown.
+    """
+    console = logging.StreamHandler()
+    console.setLevel(
+        logging.ERROR
+        if verbosity < 0
+        else (logging.WARNING, logging.INFO, logging.DEBUG)[min(verbosity, 2)]
+    )
+    console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    counter = WarningCounter()
+    logger.handlers[:] = [console, counter]
+    logger.setLevel(min(console.level, logging.WARNING))
+    logger.propagate = False
+    return counter
+
+
+def zip_data_offset(stream, zinfo) -> int:
+    """Returns offset of zip member data from its local file header."""
+    with StreamCursor(stream, zinfo.header_offset):
+        if stream.read_u32() != 0x04034B50:
+            raise BadZipFile(f"Bad local file header: '{zinfo.filename}'")
+        stream.set(zinfo.header_offset + 26)
+        name_length = stream.read_u16()
+        extra_length = stream.read_u16()
+    return zinfo.header_offset + 30 + name_length + extra_length
 
 
 def create_file_path(filepath: str) -> None:
@@ -1,7 +1,11 @@
 """Constants Pool class."""
+import logging
 import struct
+from array import array
 from enum import Enum
 
+from common import logger
+
 
 class CONST(bytes, Enum):
     CLASS = b"\x07"
@@ -25,114 +29,129 @@ class J9CONST(int, Enum):
     REF = 4
 
 
+U16 = struct.Struct(">H")
+
+
 class ConstPool:
     def __init__(self, romclass):
         self.pool = []
-        self.transform = {}
-        stack = []
-        # self.pool.append([-1, None])
-
-        for i, constant in enumerate(romclass.constant_pool):
-            if constant.type == J9CONST.INT:
-                index = len(self.pool)
-                self.pool.append([CONST.INTEGER, constant.value[::-1]])
-                self.transform[i] = {"new_index": index, "type": CONST.INTEGER}
-                print("idx %d = %s" % (index, constant.value))
-            elif constant.type == J9CONST.LONG:
-                index = len(self.pool)
-                self.pool.append([CONST.DOUBLE, constant.value[::-1]])
+        rom_pool = romclass.constant_pool
+        # ROM cp index -> pool index and tag of its entry, -1 and 0 if unmapped
+        self.new_index = array("i", [-1]) * len(rom_pool.types)
+        self.new_type = bytearray(len(rom_pool.types))
+        # (tag, payload...) -> pool index, so shared entries are written once
+        self.index = {}
+        refs = []
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        new_index = self.new_index
+        new_type = self.new_type
+        for i, (rom_type, value) in enumerate(zip(rom_pool.types, rom_pool.values)):
+            index = len(self.pool)
+            if rom_type == J9CONST.INT:
+                self.pool.append([CONST.INTEGER, value[::-1]])
+                new_type[i] = CONST.INTEGER[0]
+                if debug:
+                    logger.debug("idx %d = %s", index, value)
+            elif rom_type == J9CONST.LONG:
+                self.pool.append([CONST.DOUBLE, value[::-1]])
                 self.pool.append([-1, None])
-                self.transform[i] = {"new_index": index, "type": CONST.DOUBLE}
-            elif constant.type == J9CONST.STRING:
-                index = len(self.pool)
+                new_type[i] = CONST.DOUBLE[0]
+            elif rom_type == J9CONST.STRING:
                 self.pool.append([CONST.STRING, ""])
-                value = constant.value.encode("utf-8")
-                stack.append(
-                    (
-                        index,
-                        CONST.UTF8,
-                        struct.pack(">H", len(value)) + value,
-                    )
-                )
-                self.transform[i] = {"new_index": index, "type": CONST.STRING}
-            elif constant.type == J9CONST.CLASS:
-                index = len(self.pool)
+                refs.append((index, value.encode("utf-8")))
+                new_type[i] = CONST.STRING[0]
+            elif rom_type == J9CONST.CLASS:
                 self.pool.append([CONST.CLASS, ""])
-                value = constant.value.encode("utf-8")
-                stack.append(
-                    (
-                        index,
-                        CONST.UTF8,
-                        struct.pack(">H", len(value)) + value,
-                    )
-                )
-                self.transform[i] = {"new_index": index, "type": CONST.CLASS}
-            elif constant.type == J9CONST.REF:
-                index = len(self.pool)
+                value = value.encode("utf-8")
+                refs.append((index, value))
+                self.index.setdefault((CONST.CLASS, value), index)
+                new_type[i] = CONST.CLASS[0]
+            elif rom_type == J9CONST.REF:
+                _class, name, descriptor = value
                 const_type = (
-                    CONST.METHODREF
-                    if constant.descriptor.find("(") >= 0
-                    else CONST.FIELDREF
+                    CONST.METHODREF if descriptor.find("(") >= 0 else CONST.FIELDREF
                 )
                 self.pool.append([const_type, "", ""])
-                value_class = constant._class.encode("utf-8")
-                value_c_name = constant.name.encode("utf-8")
-                value_c_desc = constant.descriptor.encode("utf-8")
-                stack.append(
+                refs.append(
                     (
                         index,
-                        CONST.CLASS,
-                        struct.pack(">H", len(value_class)) + value_class,
+                        _class.encode("utf-8"),
+                        name.encode("utf-8"),
+                        descriptor.encode("utf-8"),
                     )
                 )
-                stack.append(
-                    (
-                        index,
-                        CONST.NAMEANDTYPE,
-                        struct.pack(">H", len(value_c_name)) + value_c_name,
-                        struct.pack(">H", len(value_c_desc)) + value_c_desc,
-                    )
-                )
-                self.transform[i] = {"new_index": index, "type": const_type}
-
-        for elem in stack:
-            cp_id = len(self.pool)
-            if elem[1] == CONST.UTF8:
-                self.pool.append([elem[1], elem[2]])
-                if self.pool[elem[0]][1]:
-                    self.pool[elem[0]][2] = struct.pack(">H", cp_id + 1)
-                else:
-                    self.pool[elem[0]][1] = struct.pack(">H", cp_id + 1)
-            elif elem[1] == CONST.CLASS:
-                self.pool.append([elem[1], ""])
-                stack.append((cp_id, CONST.UTF8, elem[2]))
-                self.pool[elem[0]][1] = struct.pack(">H", cp_id + 1)
-            elif elem[1] == CONST.NAMEANDTYPE:
-                self.pool.append([elem[1], "", ""])
-                stack.append((cp_id, CONST.UTF8, elem[2]))
-                stack.append((cp_id, CONST.UTF8, elem[3]))
-                self.pool[elem[0]][2] = struct.pack(">H", cp_id + 1)
+                new_type[i] = const_type[0]
+            else:
+                continue
+            new_index[i] = index
+
+        for elem in refs:
+            entry = self.pool[elem[0]]
+            if len(elem) == 2:
+                entry[1] = U16.pack(self._utf8(elem[1]) + 1)
+            else:
+                entry[1] = U16.pack(self._class(elem[1]) + 1)
+                entry[2] = U16.pack(self._name_and_type(elem[2], elem[3]) + 1)
+
+    def _append(self, key, entry):
+        index = len(self.pool)
+        self.pool.append(entry)
+        self.index[key] = index
+        return index
+
+    def _utf8(self, value):
+        index = self.index.get((CONST.UTF8, value))
+        if index is None:
+            index = self._append(
+                (CONST.UTF8, value), [CONST.UTF8, U16.pack(len(value)) + value]
+            )
+        return index
+
+    def _class(self, value):
+        index = self.index.get((CONST.CLASS, value))
+        if index is None:
+            name_index = self._utf8(value)
+            index = self._append(
+                (CONST.CLASS, value), [CONST.CLASS, U16.pack(name_index + 1)]
+            )
+        return index
+
+    def _name_and_type(self, name, descriptor):
+        key = (CONST.NAMEANDTYPE, name, descriptor)
+        index = self.index.get(key)
+        if index is None:
+            name_index = self._utf8(name)
+            descriptor_index = self._utf8(descriptor)
+            index = self._append(
+                key,
+                [
+                    CONST.NAMEANDTYPE,
+                    U16.pack(name_index + 1),
+                    U16.pack(descriptor_index + 1),
+                ],
+            )
+        return index
+
+    def _long(self, value):
+        index = self.index.get((CONST.LONG, value))
+        if index is None:
+            index = self._append((CONST.LONG, value), [CONST.LONG, value])
+            self.pool.append([-1, None])
+        return index
 
     def add(self, value_type, value):
         if isinstance(value, str):
             value = value.encode("utf-8")
 
         if value_type == CONST.CLASS:
-            index = len(self.pool)
-            self.pool.append([CONST.UTF8, struct.pack(">H", len(value)) + value])
-            self.pool.append([CONST.CLASS, struct.pack(">H", index + 1)])
-            return index + 2
+            return self._class(value) + 1
 
         if value_type == CONST.UTF8:
-            index = len(self.pool)
-            self.pool.append([CONST.UTF8, struct.pack(">H", len(value)) + value])
-            return index + 1
+            return self._utf8(value) + 1
 
         if value_type == CONST.LONG:
-            index = len(self.pool)
-            self.pool.append([CONST.LONG, struct.pack(">II", *value)])
-            self.pool.append([-1, None])
-            return index + 1
+            return self._long(struct.pack(">II", *value)) + 1
 
         raise ValueError(f"Unexpected value type: '{value_type}'")
 
@@ -142,16 +161,16 @@ class ConstPool:
     def get_int(self, index):
         return struct.unpack(">I", self.pool[index][1])[0]
 
-    def check_transform(self, index, transform_type=None):
-        # print(self.transform[index]["type"])
-        return index in self.transform and (
-            not transform_type or self.transform[index]["type"] == transform_type
-        )
-
     def get_transform(self, index):
-        return self.transform[index]
+        """Returns pool index of ROM cp index, raises KeyError if unmapped."""
+        new_index = self.new_index[index]
+        if new_index < 0:
+            raise KeyError(f"ROM cp index {index} is unmapped")
+        return new_index
 
     def write(self, stream):
+        if len(self.pool) + 1 > 0xFFFF:
+            raise ValueError(f"Constant pool too large: {len(self.pool) + 1}")
         stream.write_u16(len(self.pool) + 1)
         for elem in self.pool:
             if elem[0] == -1:
@@ -0,0 +1,205 @@
+"""JAR writer class."""
+import json
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+
+from common import ReaderStream, logger, zip_data_offset
+
+COMPRESSION = {"store": ZIP_STORED, "deflate": ZIP_DEFLATED}
+MANIFEST_NAME = "META-INF/jxe2jar.json"
+
+
+def compress_member(data, compress_type: int, level: int) -> tuple[bytes, int]:
+    """Returns (compressed payload, crc) of member data."""
+    crc = zlib.crc32(data)
+    if compress_type == ZIP_DEFLATED:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush(), crc
+    if compress_type == ZIP_STORED:
+        return data, crc
+    raise ValueError(f"Unsupported compression: '{compress_type}'")
+
+
+def _strip_zip64_extra(extra: bytes) -> bytes:
+    """Returns extra field without zip64 record, FileHeader adds its own."""
+    result = bytearray()
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<HH", extra, pos)
+        if header_id != 0x0001:
+            result += extra[pos : pos + 4 + size]
+        pos += 4 + size
+    return bytes(result)
+
+
+def raw_member_info(zinfo: ZipInfo) -> ZipInfo:
+    """Returns copy of source member info suitable for write_raw_member."""
+    new_zinfo = ZipInfo(zinfo.filename, zinfo.date_time)
+    for attr in (
+        "compress_type",
+        "comment",
+        "create_system",
+        "create_version",
+        "extract_version",
+        "flag_bits",
+        "internal_attr",
+        "external_attr",
+        "CRC",
+        "compress_size",
+        "file_size",
+    ):
+        setattr(new_zinfo, attr, getattr(zinfo, attr))
+    new_zinfo.extra = _strip_zip64_extra(zinfo.extra)
+    # Sizes are known up front, so no data descriptor follows the payload
+    new_zinfo.flag_bits &= ~0x08
+    return new_zinfo
+
+
+def read_raw_member(stream, zinfo: ZipInfo):
+    """Returns still compressed payload of zip member from ReaderStream."""
+    return stream.view(zip_data_offset(stream, zinfo), zinfo.compress_size)
+
+
+def write_raw_member(zip_file: ZipFile, zinfo: ZipInfo, payload) -> None:
+    """Appends member whose payload is already compressed.
+
+    zinfo must carry compress_type, CRC, compress_size and file_size.
+    """
+    if zip_file._writing:  # pylint: disable=W0212
+        raise ValueError("Can't write raw member while a write handle is open")
+    with zip_file._lock:  # pylint: disable=W0212
+        if zip_file._seekable:  # pylint: disable=W0212
+            zip_file.fp.seek(zip_file.start_dir)
+        zinfo.header_offset = zip_file.fp.tell()
+        zip_file._writecheck(zinfo)  # pylint: disable=W0212
+        zip_file._didModify = True  # pylint: disable=W0212
+        zip_file.fp.write(zinfo.FileHeader())
+        zip_file.fp.write(payload)
+        zip_file.start_dir = zip_file.fp.tell()
+        zip_file.filelist.append(zinfo)
+        zip_file.NameToInfo[zinfo.filename] = zinfo
+
+
+class JarWriter:
+    """Writes JAR members in order, deflating them in a thread pool.
+
+    zlib releases the GIL, so members are compressed concurrently while the
+    precomputed payloads and CRCs are appended in submission order.
+    """
+
+    def __init__(self, file, compression="store", level=6, threads=None):
+        self.zip_file = ZipFile(file, "w")
+        self.compress_type = COMPRESSION[compression]
+        self.level = level
+        self._executor = None
+        self._max_pending = 1
+        if self.compress_type != ZIP_STORED:
+            self._executor = ThreadPoolExecutor(threads)
+            self._max_pending = self._executor._max_workers * 2  # pylint: disable=W0212
+        self._pending = deque()
+        self.bytes_out = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, name: str, data) -> None:
+        """Queues member data for compression and writing."""
+        zinfo = ZipInfo(name, time.localtime()[:6])
+        zinfo.compress_type = self.compress_type
+        zinfo.external_attr = 0o600 << 16
+        zinfo.file_size = len(data)
+        if self._executor is None:
+            result = compress_member(data, self.compress_type, self.level)
+        else:
+            result = self._executor.submit(
+                compress_member, data, self.compress_type, self.level
+            )
+        self._pending.append((zinfo, result))
+        self._flush(self._max_pending)
+
+    def write_raw(self, zinfo: ZipInfo, payload) -> None:
+        """Queues already compressed member, written as is."""
+        self._pending.append((zinfo, payload))
+        self._flush(self._max_pending)
+
+    def _flush(self, max_pending: int) -> None:
+        """Writes finished members from queue head, waits while queue is full."""
+        pending = self._pending
+        while pending:
+            zinfo, result = pending[0]
+            if isinstance(result, Future):
+                if len(pending) <= max_pending and not result.done():
+                    break
+                payload, zinfo.CRC = result.result()
+                zinfo.compress_size = len(payload)
+            elif isinstance(result, tuple):
+                payload, zinfo.CRC = result
+                zinfo.compress_size = len(payload)
+            else:
+                payload = result
+            pending.popleft()
+            write_raw_member(self.zip_file, zinfo, payload)
+            self.bytes_out += zinfo.compress_size
+
+    def close(self) -> None:
+        """Writes queued members and closes JAR."""
+        try:
+            self._flush(0)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+            self.zip_file.close()
+
+
+def manifest_bytes(keys: dict, version: str) -> bytes:
+    """Returns manifest of class keys, read back by PreviousJar."""
+    return json.dumps(
+        {"converter": version, "classes": keys}, indent=0, sort_keys=True
+    ).encode("utf-8")
+
+
+class PreviousJar:
+    """JAR of an earlier run, source of raw copies of unchanged classes."""
+
+    def __init__(self, path, version: str):
+        self._fp_ = open(path, "rb")  # pylint: disable=R1732
+        self.stream = ReaderStream(self._fp_)
+        self.zip_file = ZipFile(self._fp_)
+        self.keys = {}
+        try:
+            manifest = json.loads(self.zip_file.read(MANIFEST_NAME))
+        except KeyError:
+            logger.info("incremental: %s has no manifest, converting all", path)
+            return
+        if manifest.get("converter") != version:
+            logger.info("incremental: converter changed since %s", path)
+            return
+        self.keys = manifest["classes"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def raw_class(self, class_name: str, key: str):
+        """Returns (member info, payload) of unchanged class or None."""
+        if self.keys.get(class_name) != key:
+            return None
+        try:
+            zinfo = self.zip_file.getinfo(f"{class_name}.class")
+        except KeyError:
+            return None
+        return raw_member_info(zinfo), read_raw_member(self.stream, zinfo)
+
+    def close(self) -> None:
+        """Closes JAR file."""
+        self.zip_file.close()
+        self._fp_.close()
@@ -1,13 +1,21 @@
 """JXE class."""
 # pylint: disable=W0612
+import logging
 import struct
+import sys
+from array import array
+from collections.abc import Sequence
 from enum import Enum
-from io import IOBase
-from zipfile import ZipFile
+from zipfile import ZIP_STORED, ZipFile
 
-from bitstring import BitArray
-from common import ReaderStream, StreamCursor, WriterStream  # noqa: F401
-# from bytecode import estimate_bc_size
+from common import (  # noqa: F401
+    BufferReader,
+    ReaderStream,
+    StreamCursor,
+    WriterStream,
+    logger,
+    zip_data_offset,
+)
 
 
 class ConstType(int, Enum):
@@ -23,13 +31,15 @@ class ConstType(int, Enum):
 class J9ROMField:
     """J9 Field."""
 
+    __slots__ = ("name", "signature", "access_flag")
+
     def __init__(self, name, signature, access_flag):
         self.name = name
         self.signature = signature
         self.access_flag = access_flag
 
     @staticmethod
-    def read(stream: BitArray):
+    def read(stream: ReaderStream):
         """Returns J9 Field from stream."""
         name = stream.read_string_ref()
         signature = stream.read_string_ref()
@@ -50,6 +60,8 @@ class J9ROMField:
 class J9ROMCatchException:
     """J9 Catch Exception."""
 
+    __slots__ = ("start", "end", "handler", "catch_type")
+
     def __init__(self, start, end, handler, catch_type):
         self.start = start
         self.end = end
@@ -57,7 +69,7 @@ class J9ROMCatchException:
         self.catch_type = catch_type
 
     @staticmethod
-    def read(stream: BitArray):
+    def read(stream: ReaderStream):
         """Returns J9 Catch Exception from stream."""
         start = stream.read_u32()
         end = stream.read_u32()
@@ -69,11 +81,13 @@ class J9ROMCatchException:
 class J9ROMThrowException:
     """J9 Throw Exception."""
 
+    __slots__ = ("throw_type",)
+
     def __init__(self, throw_type):
         self.throw_type = throw_type
 
     @staticmethod
-    def read(stream: BitArray):
+    def read(stream: ReaderStream):
         """Returns J9 Throw Exception"""
         return J9ROMThrowException(stream.read_string_ref())
 
@@ -81,6 +95,18 @@ class J9ROMThrowException:
 class J9ROMMethod:
     """J9 MMethod."""
 
+    __slots__ = (
+        "name",
+        "signature",
+        "modifier",
+        "max_stack",
+        "arg_count",
+        "temp_count",
+        "bytecode",
+        "catch_exceptions",
+        "throw_exceptions",
+    )
+
     def __init__(
         self,
         name,
@@ -104,7 +130,7 @@ class J9ROMMethod:
         self.throw_exceptions = throw_exceptions
 
     @staticmethod
-    def read(stream: BitArray):
+    def read(stream: ReaderStream):
         """Returns J9 Method."""
         # print(stream.get())
         name = stream.read_string_ref()
@@ -139,10 +165,16 @@ class J9ROMMethod:
                 stream.read_u32()
             if modifier & 0x20000:
                 stream.read_bytes(stream.read_u16() * 16 + 4 * stream.read_u16())
-            caught_exceptions = []
-            thrown_exceptions = []
+            caught_exceptions = ()
+            thrown_exceptions = ()
             bytecode = stream.read_bytes(0)
-            print("Native method", stream.get(), hex(modifier), arg_count, name)
+            logger.debug(
+                "Native method %d %s %d %s",
+                stream.get(),
+                hex(modifier),
+                arg_count,
+                name,
+            )
             
 
         else:
@@ -155,7 +187,7 @@ class J9ROMMethod:
                 bytecode_size += bytecode_size_high << 16
             # print("bc size %d" % bytecode_size)
             # print("argcnt %d" % arg_count)
-            # print("bc size est %d" % estimate_bc_size(stream, bytecode_size_low - 6))
+            # transform_bytecode checks this size against OPCODE_LENGTHS
             bytecode = stream.read_bytes(bytecode_size)
             stream.set((stream.get() + 3) & ~3)
             if has_bytecode_extra:
@@ -170,8 +202,8 @@ class J9ROMMethod:
                     for i in range(thrown_exception_count)
                 ]
             else:
-                caught_exceptions = []
-                thrown_exceptions = []
+                caught_exceptions = ()
+                thrown_exceptions = ()
 
             # if add_four2:
             # stream.read_u32()
@@ -192,11 +224,13 @@ class J9ROMMethod:
 class J9ROMInterface:
     """J9 Interface."""
 
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
     @staticmethod
-    def read(stream: BitArray):
+    def read(stream: ReaderStream):
         """ "Returns J9 Interface from stream."""
         name = stream.read_string_ref()
         return J9ROMInterface(name)
@@ -205,6 +239,8 @@ class J9ROMInterface:
 class J9ROMConstant:
     """J9 Constant."""
 
+    __slots__ = ("type", "value", "_class", "name", "descriptor")
+
     def __init__(self, cons_type, value=None, _class=None, name=None, descriptor=None):
         self.type = cons_type
         match cons_type:
@@ -217,44 +253,53 @@ class J9ROMConstant:
                 self.name = name
                 self.descriptor = descriptor
 
-    @staticmethod
-    def read(stream: BitArray, base):
-        """Returns J9 constant from stream."""
-        pos = stream.get()
-        value = stream.read_u32()
-        value_type = stream.read_u32()
-
-        match value_type:
-            case ConstType.STRING | ConstType.CLASS:
-                value = struct.unpack("<i", struct.pack("<I", value))[0]
-                ptr = pos + value
-                with StreamCursor(stream, ptr):
-                    value = stream.read_string()
-            case ConstType.INT:
-                value = struct.pack("<I", value)
-            case _:
-                class_ptr = base + 8 * value
-                try:
-                    with StreamCursor(stream, class_ptr):
-                        _class = stream.read_string_ref()
-                    ptr = value_type + pos + 4
-                    with StreamCursor(stream, ptr):
-                        name = stream.read_string_ref()
-                        descriptor = stream.read_string_ref()
-                    return J9ROMConstant(
-                        ConstType.REF, _class=_class, name=name, descriptor=descriptor
-                    )
-                except Exception as exc:
-                    value = struct.pack("<II", value, value_type)
-                    value_type = 3
-                    print(exc)
 
-        return J9ROMConstant(value_type, value=value)
+class J9ROMConstantPool(Sequence):
+    """J9 Constant pool stored as parallel arrays.
+
+    types holds constant type codes, values holds the value of each constant
+    (a (class, name, descriptor) tuple for REF constants). Indexing builds a
+    J9ROMConstant on demand.
+    """
+
+    __slots__ = ("types", "values")
+
+    def __init__(self):
+        self.types = array("B")
+        self.values = []
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        cons_type = ConstType(self.types[index])
+        value = self.values[index]
+        if cons_type == ConstType.REF:
+            return J9ROMConstant(
+                cons_type, _class=value[0], name=value[1], descriptor=value[2]
+            )
+        return J9ROMConstant(cons_type, value=value)
 
 
 class J9ROMClass:
     """J9 Class."""
 
+    __slots__ = (
+        "minor",
+        "major",
+        "class_name",
+        "superclass_name",
+        "access_flags",
+        "interfaces",
+        "methods",
+        "fields",
+        "constant_pool",
+        "rom_size",
+        "crc",
+    )
+
     def __init__(
         self,
         minor,
@@ -266,6 +311,8 @@ class J9ROMClass:
         methods,
         fields,
         constant_pool,
+        rom_size=0,
+        crc=0,
     ):
         self.minor = minor
         self.major = major
@@ -276,18 +323,132 @@ class J9ROMClass:
         self.methods = methods
         self.fields = fields
         self.constant_pool = constant_pool
+        self.rom_size = rom_size
+        self.crc = crc
+
+    CRC_OFFSET = 0x3C
+
+    _I32_ = struct.Struct("<i")
+    _U16_ = struct.Struct("<H")
+    _LONG_ = struct.Struct("<II")
 
     @staticmethod
-    def read(stream: BitArray):
-        """Returns J9 Class from stream."""
-        class_name = stream.read_string_ref()
-        class_pointer = stream.read_relative()
+    def read_constant_pool(stream: ReaderStream, base: int, count: int):
+        """Returns J9 Constant pool of count (value, type) u32 pairs at base.
+
+        All pairs are read as one block. Constants are classified by bounds
+        checks instead of exceptions, then strings are decoded in ascending
+        offset order. Constants past the stream end or with unreadable
+        strings are dropped, and REF constants with unreadable targets are
+        the halves of a LONG.
+        """
+        # pylint: disable=R0912, R0914
+        # String pointers reach anywhere in the image, buffer doesn't copy it
+        data = stream.buffer
+        size = len(data)
+        unpack_i32 = J9ROMClass._I32_.unpack_from
+        unpack_u16 = J9ROMClass._U16_.unpack_from
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        def string_fits(ptr):
+            return 0 <= ptr <= size - 2 and ptr + 2 + unpack_u16(data, ptr)[0] <= size
+
+        count = max(0, min(count, (size - base) // 8))
+        words = array("I")
+        words.frombytes(data[base : base + 8 * count])
+        if sys.byteorder == "big":
+            words.byteswap()
+
+        constant_pool = J9ROMConstantPool()
+        types = constant_pool.types
+        values = constant_pool.values
+        strings = []  # (slot, string offset)
+        refs = []  # (slot, class/name/descriptor string offsets, LONG words)
+        pos = base - 8
+        for value, value_type in zip(words[0::2], words[1::2]):
+            pos += 8
+            if value_type == ConstType.INT:
+                types.append(ConstType.INT)
+                values.append(value.to_bytes(4, "little"))
+                continue
+            if value_type == ConstType.STRING or value_type == ConstType.CLASS:
+                ptr = pos + (value ^ 0x80000000) - 0x80000000
+                if string_fits(ptr):
+                    strings.append((len(types), ptr))
+                    types.append(value_type)
+                    values.append(None)
+                continue
+            class_ptr = base + 8 * value
+            nas_ptr = pos + 4 + value_type
+            if 0 <= class_ptr <= size - 4 and nas_ptr <= size - 8:
+                class_name = class_ptr + unpack_i32(data, class_ptr)[0]
+                name = nas_ptr + unpack_i32(data, nas_ptr)[0]
+                descriptor = nas_ptr + 4 + unpack_i32(data, nas_ptr + 4)[0]
+                if (
+                    string_fits(class_name)
+                    and string_fits(name)
+                    and string_fits(descriptor)
+                ):
+                    refs.append(
+                        (len(types), class_name, name, descriptor, value, value_type)
+                    )
+                    types.append(ConstType.REF)
+                    values.append(None)
+                    continue
+            if debug:
+                logger.debug("Constant at %d read as long", pos)
+            types.append(ConstType.LONG)
+            values.append(J9ROMClass._LONG_.pack(value, value_type))
+
+        decoded = {}
+        bad = set()
+        targets = {ptr for _, ptr in strings}
+        for _, class_name, name, descriptor, _, _ in refs:
+            targets.add(class_name)
+            targets.add(name)
+            targets.add(descriptor)
+        for ptr in sorted(targets):
+            try:
+                decoded[ptr] = stream.read_string_at(ptr)
+            except UnicodeDecodeError as exc:
+                decoded[ptr] = exc
+                bad.add(ptr)
+        for slot, ptr in strings:
+            if ptr in bad:
+                raise decoded[ptr]
+            values[slot] = decoded[ptr]
+        for slot, class_name, name, descriptor, value, value_type in refs:
+            if bad and (class_name in bad or name in bad or descriptor in bad):
+                logger.debug("Constant %d read as long: bad string", slot)
+                types[slot] = ConstType.LONG
+                values[slot] = J9ROMClass._LONG_.pack(value, value_type)
+            else:
+                values[slot] = (
+                    decoded[class_name],
+                    decoded[name],
+                    decoded[descriptor],
+                )
+        return constant_pool
 
+    @staticmethod
+    def read_header(stream: ReaderStream, class_pointer: int):
+        """Returns (class name, rom size, crc) of J9 Class without decoding it."""
         with StreamCursor(stream, class_pointer):
-            rom_size = stream.read_u32()  # noqa: F841
+            rom_size = stream.read_u32()
+            stream.read_u32()
+            class_name = stream.read_string_ref()
+            stream.set(class_pointer + J9ROMClass.CRC_OFFSET)
+            crc = stream.read_u32()
+        return class_name, rom_size, crc
+
+    @staticmethod
+    def read(stream: ReaderStream, class_pointer: int):
+        """Returns J9 Class located at class pointer from stream."""
+        with StreamCursor(stream, class_pointer):
+            rom_size = stream.read_u32()
             single_scalar_static_count = stream.read_u32()  # noqa: F841
             class_name = stream.read_string_ref()
-            print(class_name)
+            logger.debug("Reading class %s", class_name)
             superclass_name = stream.read_string_ref()
             access_flags = stream.read_u32()
             interface_count = stream.read_u32()
@@ -314,7 +475,7 @@ class J9ROMClass:
             double_scalar_static_count = stream.read_u32()  # noqa: F841
             ram_constant_pool_count = stream.read_u32()  # noqa: F841
             rom_constant_pool_count = stream.read_u32()
-            crc = stream.read_u32()  # noqa: F841
+            crc = stream.read_u32()
             instance_size = stream.read_u32()  # noqa: F841
             instance_shape = stream.read_u32()  # noqa: F841
             cp_shape_description_pointer = stream.read_relative()  # noqa: F841
@@ -338,18 +499,9 @@ class J9ROMClass:
                     # enclosing_method = stream.read_sprr(optional_flags, 0x40)
                     # simple_name = stream.read_sprr(optional_flags, 0x80)
 
-            base = stream.get()
-            constant_pool_count = rom_constant_pool_count
-            constant_pool = []
-
-            for i in range(constant_pool_count):
-                try:
-                    constant_pool.append(J9ROMConstant.read(stream, base))
-                except EOFError:
-                    # Usual between ram_constant_pool_count and rom_constant_pool_count
-                    # liy double const but in some cases last element contain not valid
-                    # string const, so we skip sthis case
-                    pass
+            constant_pool = J9ROMClass.read_constant_pool(
+                stream, stream.get(), rom_constant_pool_count
+            )
 
         return J9ROMClass(
             minor,
@@ -361,9 +513,60 @@ class J9ROMClass:
             methods,
             fields,
             constant_pool,
+            rom_size,
+            crc,
         )
 
 
+class J9ROMClassTable(Sequence):
+    """J9 Classes indexed by TOC, decoded on access."""
+
+    def __init__(self, stream: ReaderStream, names, pointers):
+        self._stream_ = stream
+        self.names = names
+        self.pointers = pointers
+        self._index_ = None
+
+    def __len__(self) -> int:
+        return len(self.pointers)
+
+    def __getitem__(self, index):
+        """Decodes J9 Class; result is not cached, so it can be dropped."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return J9ROMClass.read(self._stream_, self.pointers[index])
+
+    def header(self, index):
+        """Returns (class name, rom size, crc) of class without decoding it."""
+        return J9ROMClass.read_header(self._stream_, self.pointers[index])
+
+    def rom_bytes(self, index, rom_size=None):
+        """Returns raw ROM class bytes (a view where the backend allows it)."""
+        pointer = self.pointers[index]
+        if rom_size is None:
+            rom_size = J9ROMClass.read_header(self._stream_, pointer)[1]
+        return self._stream_.view(pointer, rom_size)
+
+    def index_of(self, class_name: str) -> int:
+        """Returns TOC index of class name."""
+        if self._index_ is None:
+            self._index_ = {name: i for i, name in enumerate(self.names)}
+        try:
+            return self._index_[class_name]
+        except KeyError:
+            raise ValueError(f"Class not found: '{class_name}'") from None
+
+    @staticmethod
+    def read(stream: ReaderStream, class_count: int):
+        """Returns J9 Class table from TOC entries (name, class pointer)."""
+        names = []
+        pointers = array("q")
+        for i in range(class_count):
+            names.append(stream.read_string_ref())
+            pointers.append(stream.read_relative())
+        return J9ROMClassTable(stream, names, pointers)
+
+
 class J9ROMImage:
     """J9 Image."""
 
@@ -374,9 +577,18 @@ class J9ROMImage:
         self.symbol_file_id = symbol_file_id
         self.classes = classes
 
+    @property
+    def class_names(self) -> list:
+        """Returns class names from TOC without decoding classes."""
+        return self.classes.names
+
+    def get_class(self, class_name: str):
+        """Returns single decoded J9 Class by name."""
+        return self.classes[self.classes.index_of(class_name)]
+
     @staticmethod
-    def read(stream: BitArray):
-        """Returns J9 Image from stream."""
+    def read(stream: ReaderStream):
+        """Returns J9 Image from stream, only TOC is parsed up front."""
         signature = stream.read_u32()
         flags_and_version = stream.read_u32()
         rom_size = stream.read_u32()
@@ -386,10 +598,8 @@ class J9ROMImage:
         first_class_pointer = stream.read_relative()  # noqa: F841
         aot_pointer = stream.read_relative()  # noqa: F841
         symbol_file_id = stream.read_bytes(0x10)
-        pos = stream.get()
-        stream.set(toc_pointer)
-        classes = [J9ROMClass.read(stream) for i in range(class_count)]
-        stream.set(pos)
+        with StreamCursor(stream, toc_pointer):
+            classes = J9ROMClassTable.read(stream, class_count)
 
         return J9ROMImage(
             signature, flags_and_version, rom_size, symbol_file_id, classes
@@ -399,13 +609,34 @@ class J9ROMImage:
 class JXE:
     """JXE object."""
 
-    def __init__(self, image):
+    ROM_NAME = "rom.classes"
+
+    def __init__(self, image, stream=None, members=()):
         self.image = image
+        self.stream = stream
+        self.members = members
 
     @staticmethod
-    def read(stream: IOBase):
-        """Returns JXE class from file object reading."""
-        with ZipFile(stream.file_object) as fp_zipfile:
-            with fp_zipfile.open("rom.classes") as rom:
-                rom_stream = ReaderStream.bytes_to_stream(rom.read())
-                return JXE(J9ROMImage.read(rom_stream))
+    def read(stream: ReaderStream):
+        """Returns JXE class from file or buffer stream reading."""
+        file_object = stream.file_object
+        if file_object is None:
+            # In-memory JXE, zip directory is read from the buffer in place
+            file_object = BufferReader(stream.view(0, stream.len))
+        with ZipFile(file_object) as fp_zipfile:
+            info = fp_zipfile.getinfo(JXE.ROM_NAME)
+            if info.compress_type == ZIP_STORED and not info.flag_bits & 0x1:
+                # Stored image is parsed in place from the (mapped) outer stream
+                rom_stream = stream.sub_stream(
+                    zip_data_offset(stream, info), info.file_size
+                )
+            else:
+                with fp_zipfile.open(info) as rom:
+                    rom_stream = type(stream).bytes_to_stream(rom.read())
+            # Other members (resources) stay in the outer stream for raw copy
+            members = [
+                member
+                for member in fp_zipfile.infolist()
+                if member.filename != JXE.ROM_NAME
+            ]
+            return JXE(J9ROMImage.read(rom_stream), stream, members)
@@ -1,21 +1,48 @@
 """Converts JXE to JAR file."""
-import io
+import argparse
+import contextlib
+import cProfile
+import fnmatch
+import functools
+import glob
+import multiprocessing
+import os
+import os.path
+import re
+import signal
 import sys
-import zipfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
 
 from bytecode import transform_bytecode
+from cache import ClassCache, class_keys, converter_version
+from common import logger, setup_logging
 from constpool import CONST, ConstPool
+from jarwriter import (
+    COMPRESSION,
+    MANIFEST_NAME,
+    JarWriter,
+    PreviousJar,
+    manifest_bytes,
+    raw_member_info,
+    read_raw_member,
+)
 from jxe import JXE, ReaderStream, WriterStream
+from profiling import NULL_PROFILER, Profiler
 
 
 def dump_romclass(
-    stream, romclass
+    stream, romclass, profiler=NULL_PROFILER
 ) -> tuple[ConstPool, list]:  # pylint: disable=R0914, R0915
     """Dumps romclass."""
     stream.write_raw_bytes(b"\xca\xfe\xba\xbe")
     stream.write_u16(romclass.minor)
     stream.write_u16(romclass.major)
     const_pool = ConstPool(romclass)
+    profiler.lap("cp_build")
     class_name_id = const_pool.add(CONST.CLASS, romclass.class_name)
     superclass_name_id = const_pool.add(CONST.CLASS, romclass.superclass_name)
     interface_id_list = []
@@ -76,6 +103,7 @@ def dump_romclass(
             }
         )
 
+    profiler.lap("transform")
     const_pool.write(stream)
 
     stream.write_u16(romclass.access_flags & 0xFFFF)
@@ -126,39 +154,662 @@ def dump_romclass(
             raise NotImplementedError()
 
     stream.write_u16(0)
+    profiler.lap("serialize")
 
     return method_info_list, const_pool
 
 
-def create_class(romclass, jarfile) -> None:
-    """Creates class"""
-    class_name = romclass.class_name
-    class_file = f"{class_name}.class"
-    f_stream = io.BytesIO()
-    stream = WriterStream(f_stream)
-    res = dump_romclass(stream, romclass)
-    stream.write()
-    jarfile.writestr(class_file, f_stream.getvalue())
-    return res
+def iter_romclasses(classes, indexes=None, profiler=NULL_PROFILER):
+    """Decodes classes one at a time in TOC order.
 
+    Yields (class name, J9 class, error), the class is only referenced by the
+    consumer, so it can be collected as soon as it's converted.
+    """
+    for index in range(len(classes)) if indexes is None else indexes:
+        profiler.start_class(classes.names[index])
+        try:
+            romclass = classes[index]
+        except Exception as exc:  # pylint: disable=W0718
+            profiler.lap("parse")
+            yield classes.names[index], None, exc
+            continue
+        profiler.lap("parse")
+        yield romclass.class_name, romclass, None
 
-def _create_jar(jar_name, jxe):
-    with zipfile.ZipFile(jar_name, "w") as jar_zipfile:
-        for romclass in jxe.image.classes:
-            print("Creating class", romclass.class_name)
+
+def iter_class_files(romclasses, profiler=NULL_PROFILER):
+    """Converts decoded classes, yields (class name, class bytes, error)."""
+    for class_name, romclass, exc in romclasses:
+        if exc is None:
             try:
-                create_class(romclass, jar_zipfile)
-            except Exception as exc:  # pylint: disable=W0718
-                print("bad class, skip", romclass.class_name, ": ", exc)
+                stream = WriterStream()
+                _, const_pool = dump_romclass(stream, romclass, profiler)
+                profiler.note(
+                    rom_size=romclass.rom_size,
+                    rom_cp=len(romclass.constant_pool),
+                    cp=len(const_pool.pool) + 1,
+                )
+            except Exception as err:  # pylint: disable=W0718
+                exc = err
+        del romclass
+        yield class_name, None if exc else stream.getvalue(), exc
+
+
+_WORKER_JXE = {}
+_WORKER_JXE_MAX = 2
+
+
+def _init_worker(log_queue, level) -> None:
+    """Sends worker log records to the parent process."""
+    # Forked workers inherit the server's SIGTERM to KeyboardInterrupt mapping
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    logger.handlers[:] = [QueueHandler(log_queue)]
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def start_worker_pool(stack, jobs) -> ProcessPoolExecutor:
+    """Returns process pool logging through this process logger.
+
+    Pool and log listener are shut down when the exit stack unwinds.
+    """
+    log_queue = multiprocessing.Queue()
+    # Records are passed to the logger rather than a copy of its handler list,
+    # so handlers added later (like per request counters) see worker records
+    listener = QueueListener(log_queue, logger, respect_handler_level=True)
+    listener.start()
+    stack.callback(listener.stop)
+    return stack.enter_context(
+        ProcessPoolExecutor(
+            jobs,
+            initializer=_init_worker,
+            initargs=(log_queue, logger.getEffectiveLevel()),
+        )
+    )
+
+
+def _file_stamp(path) -> tuple[int, int]:
+    """Returns (mtime ns, size) telling apart versions of a file."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _convert_toc_entry(task) -> tuple[str, bytes, Exception]:
+    """Worker entry, converts (jxe name, stamp, TOC index) using worker's image.
+
+    Images are kept by name and file stamp, so long-lived pools notice when a
+    JXE is replaced.
+    """
+    jxe_name, stamp, index = task
+    jxe = _WORKER_JXE.get((jxe_name, stamp))
+    if jxe is None:
+        # Batches walk images in order, so only the latest ones are kept
+        while len(_WORKER_JXE) >= _WORKER_JXE_MAX:
+            del _WORKER_JXE[next(iter(_WORKER_JXE))]
+        with open(jxe_name, "rb") as fp_jxe:
+            jxe = _WORKER_JXE[(jxe_name, stamp)] = JXE.read(ReaderStream(fp_jxe))
+    return next(iter_class_files(iter_romclasses(jxe.image.classes, (index,))))
+
+
+def _map_chunk(func, chunk) -> list:
+    """Worker entry, applies func to a chunk of tasks."""
+    return [func(task) for task in chunk]
+
+
+def bounded_map(executor, func, tasks, jobs):
+    """Maps func over tasks in executor, yielding results in task order.
+
+    Unlike executor.map, tasks are submitted lazily and at most jobs * 4
+    chunks are in flight, so finished classes can't pile up in memory while
+    the JAR writer falls behind.
+    """
+    tasks = list(tasks)
+    chunksize = max(1, len(tasks) // (jobs * 8))
+    tasks = iter(tasks)
+    pending = deque()
+    while True:
+        while len(pending) < jobs * 4:
+            chunk = list(islice(tasks, chunksize))
+            if not chunk:
+                break
+            pending.append(executor.submit(_map_chunk, func, chunk))
+        if not pending:
+            return
+        yield from pending.popleft().result()
+
+
+def iter_cached_class_files(classes, cache, convert, indexes=None, keys=None):
+    """Yields class files in TOC order, converting only cache misses.
+
+    convert maps a list of TOC indexes to an iterator of class files. keys
+    are precomputed class keys, classes without key are never cached.
+    """
+    if indexes is None:
+        indexes = range(len(classes))
+    if keys is None:
+        keys = class_keys(classes, indexes, cache.version)
+    misses = [i for i in indexes if i not in keys or keys[i] not in cache]
+    converted = convert(misses)
+    missed = set(misses)
+    hits, misses_before = cache.hits, cache.misses
+    for index in indexes:
+        key = keys.get(index)
+        if index not in missed:
+            data = cache.get(key)
+            if data is not None:
+                yield classes.names[index], data, None
+                continue
+            # Entry vanished after lookup, convert it here
+            result = next(iter_class_files(iter_romclasses(classes, (index,))))
+        else:
+            result = next(converted)
+            cache.misses += 1
+        if result[2] is None and key is not None:
+            cache.put(key, result[1])
+        yield result
+    logger.info(
+        "cache: %d hits, %d misses", cache.hits - hits, cache.misses - misses_before
+    )
+
+
+def iter_incremental_class_files(classes, indexes, keys, previous, convert):
+    """Yields class files in TOC order, converting only changed classes.
+
+    Unchanged classes are yielded as (member info, payload) of previous JAR,
+    classes without key are always converted.
+    """
+    raw = {}
+    for index in indexes:
+        if index not in keys:
+            continue
+        member = previous.raw_class(classes.names[index], keys[index])
+        if member is not None:
+            raw[index] = member
+    logger.info("incremental: %d of %d classes unchanged", len(raw), len(indexes))
+    converted = convert([index for index in indexes if index not in raw])
+    for index in indexes:
+        member = raw.get(index)
+        if member is None:
+            yield next(converted)
+        else:
+            yield classes.names[index], member, None
+
+
+def write_class_files(
+    jar_writer, class_files, profiler=NULL_PROFILER, manifest=None
+) -> tuple[int, int]:
+    """Streams converted classes into JAR as they arrive.
+
+    Returns (classes written, classes skipped), skipped classes are removed
+    from manifest.
+    """
+    written = skipped = 0
+    for class_name, data, exc in class_files:
+        logger.info("Creating class %s", class_name)
+        if exc is not None:
+            logger.warning("bad class, skip: %s: %s", class_name, exc)
+            skipped += 1
+            if manifest is not None:
+                manifest.pop(class_name, None)
+            profiler.end_class()
+            continue
+        if isinstance(data, tuple):
+            # Raw member copied from previous JAR
+            jar_writer.write_raw(*data)
+            written += 1
+            profiler.lap("zip")
+            continue
+        jar_writer.write(f"{class_name}.class", data)
+        written += 1
+        profiler.lap("zip")
+        profiler.end_class(len(data))
+    return written, skipped
+
+
+def _compile_globs(patterns):
+    """Returns regex matching class names against package globs.
+
+    Dots in patterns stand for '/', '*' also spans nested packages.
+    """
+    if not patterns:
+        return None
+    return re.compile(
+        "|".join(fnmatch.translate(pattern.replace(".", "/")) for pattern in patterns)
+    )
+
+
+def select_classes(names, include=None, exclude=None) -> list[int]:
+    """Returns TOC indexes of class names matching include and not exclude."""
+    include_re = _compile_globs(include)
+    exclude_re = _compile_globs(exclude)
+    return [
+        index
+        for index, name in enumerate(names)
+        if (include_re is None or include_re.match(name))
+        and (exclude_re is None or not exclude_re.match(name))
+    ]
+
+
+def copy_members(jar_writer, jxe, skip_names) -> int:
+    """Copies non-class JXE members into JAR without recompressing them.
+
+    Members named in skip_names or repeated are skipped, returns number of
+    members copied.
+    """
+    copied = 0
+    for zinfo in jxe.members:
+        if zinfo.filename in skip_names:
+            logger.warning("duplicate member, skip: %s", zinfo.filename)
+            continue
+        logger.info("Copying member %s", zinfo.filename)
+        jar_writer.write_raw(raw_member_info(zinfo), read_raw_member(jxe.stream, zinfo))
+        skip_names.add(zinfo.filename)
+        copied += 1
+    return copied
+
+
+def _make_converter(classes, jxe_name, executor, jobs, cache, profiler, keys=None):
+    """Returns function mapping TOC indexes to an iterator of class files."""
+    if executor is not None:
+        # Workers decode classes themselves, only TOC indexes are sent
+        stamp = _file_stamp(jxe_name)
+
+        def convert(indexes):
+            tasks = [(jxe_name, stamp, i) for i in indexes]
+            return bounded_map(executor, _convert_toc_entry, tasks, jobs)
+
+    else:
+
+        def convert(indexes):
+            return iter_class_files(
+                iter_romclasses(classes, indexes, profiler), profiler
+            )
+
+    if cache is not None:
+        return functools.partial(
+            iter_cached_class_files, classes, cache, convert, keys=keys
+        )
+    return convert
+
+
+def _is_path(obj) -> bool:
+    return isinstance(obj, (str, os.PathLike))
+
+
+def open_jxe(source, stack) -> tuple[JXE, ReaderStream]:
+    """Returns (JXE, stream) read from path, bytes-like buffer or binary file.
+
+    A file opened from path is closed when the exit stack unwinds.
+    """
+    if _is_path(source):
+        source = stack.enter_context(open(source, "rb"))
+    stream = ReaderStream(source)
+    return JXE.read(stream), stream
+
+
+def convert(source, include=None, exclude=None):
+    """Converts JXE lazily, yields (class name, class bytes) in TOC order.
+
+    source is a path, a bytes-like JXE payload or a binary file object.
+    Classes failing to convert are logged and skipped.
+    """
+    with contextlib.ExitStack() as stack:
+        classes = open_jxe(source, stack)[0].image.classes
+        indexes = select_classes(classes.names, include, exclude)
+        for class_name, data, exc in iter_class_files(
+            iter_romclasses(classes, indexes)
+        ):
+            if exc is not None:
+                logger.warning("bad class, skip: %s: %s", class_name, exc)
+                continue
+            yield class_name, data
+
+
+def write_jar(
+    source,
+    jar,
+    executor=None,
+    jobs=1,
+    cache=None,
+    compression="store",
+    level=6,
+    include=None,
+    exclude=None,
+    profiler=NULL_PROFILER,
+    old_jar=None,
+    resources=True,
+    manifest=False,
+) -> tuple[int, int]:  # pylint: disable=R0912, R0913, R0914, R0915
+    """Converts JXE into JAR, returns (classes written, classes skipped).
+
+    source is a path, a bytes-like JXE payload or a binary file object, jar is
+    a path or a writable binary stream (which is left open). Worker executor
+    is only used for JXE paths. Only classes selected by include/exclude globs
+    are decoded. With old_jar, classes unchanged since the run that wrote it
+    are copied raw from it. Other JXE members are copied as is unless
+    resources is false. With manifest or old_jar, the JAR gets a manifest of
+    class keys for later incremental runs.
+    """
+    jxe_name = os.fspath(source) if _is_path(source) else None
+    # A missing old JAR is a first incremental run, the next one needs keys
+    manifest = manifest or old_jar is not None
+    if old_jar is not None and not os.path.exists(old_jar):
+        logger.info("incremental: %s not found, converting all", old_jar)
+        old_jar = None
+    out_jar = jar
+    if (
+        old_jar is not None
+        and _is_path(jar)
+        and os.path.exists(jar)
+        and os.path.samefile(old_jar, jar)
+    ):
+        # Old JAR is still read while the new one is written
+        out_jar = f"{os.fspath(jar)}.tmp"
+    try:
+        with contextlib.ExitStack() as stack:
+            profiler.start()
+            jxe, stream = open_jxe(source, stack)
+            classes = jxe.image.classes
+            indexes = select_classes(classes.names, include, exclude)
+            version = cache.version if cache is not None else converter_version()
+            keys = None
+            if manifest or cache is not None:
+                # Keys hash every selected ROM class, so only when used
+                keys = class_keys(classes, indexes, version)
+            profiler.lap("image")
+            previous = None
+            if old_jar is not None:
+                previous = stack.enter_context(PreviousJar(old_jar, version))
+            jar_writer = stack.enter_context(JarWriter(out_jar, compression, level))
+            convert_indexes = _make_converter(
+                classes,
+                jxe_name,
+                executor if jxe_name is not None else None,
+                jobs,
+                cache,
+                profiler,
+                keys,
+            )
+            if previous is not None:
+                class_files = iter_incremental_class_files(
+                    classes, indexes, keys, previous, convert_indexes
+                )
+            else:
+                class_files = convert_indexes(indexes)
+            manifest_keys = None
+            if manifest:
+                manifest_keys = {
+                    classes.names[index]: key for index, key in keys.items()
+                }
+            # Results keep TOC order, so the JAR layout doesn't depend on jobs
+            result = write_class_files(jar_writer, class_files, profiler, manifest_keys)
+            if resources:
+                skip_names = {f"{classes.names[index]}.class" for index in indexes}
+                if manifest:
+                    skip_names.add(MANIFEST_NAME)
+                copy_members(jar_writer, jxe, skip_names)
+                profiler.lap("zip")
+            if manifest:
+                jar_writer.write(MANIFEST_NAME, manifest_bytes(manifest_keys, version))
+            profiler.start()
+        if out_jar is not jar:
+            os.replace(out_jar, jar)
+    except BaseException:
+        if out_jar is not jar and os.path.exists(out_jar):
+            os.remove(out_jar)
+        raise
+    profiler.lap("zip")
+    profiler.add_file(
+        jxe_name or "<buffer>",
+        stream.len,
+        os.path.getsize(jar) if _is_path(jar) else jar_writer.bytes_out,
+    )
+    return result
+
+
+def list_classes(jxe_names, include=None, exclude=None) -> None:
+    """Prints selected class names of each JXE from its TOC."""
+    for jxe_name in jxe_names:
+        if len(jxe_names) > 1:
+            print(f"{jxe_name}:")
+        with open(jxe_name, "rb") as fp_jxe:
+            names = JXE.read(ReaderStream(fp_jxe)).image.class_names
+            for index in select_classes(names, include, exclude):
+                print(names[index])
+
+
+def expand_inputs(patterns) -> list[str]:
+    """Expands directories (to their *.jxe) and glob patterns into JXE paths."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, "*.jxe"))))
+        elif glob.has_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def batch_jar_names(jxe_names, output_dir) -> list[str]:
+    """Returns output JAR path of each JXE, raises ValueError on clashes."""
+    jar_names = []
+    seen = {}
+    for jxe_name in jxe_names:
+        stem = os.path.splitext(os.path.basename(jxe_name))[0]
+        jar_name = os.path.join(output_dir, f"{stem}.jar")
+        if jar_name in seen:
+            raise ValueError(
+                f"'{jxe_name}' and '{seen[jar_name]}' both convert to '{jar_name}'"
+            )
+        seen[jar_name] = jxe_name
+        jar_names.append(jar_name)
+    return jar_names
+
+
+def _run_batch(args, **options) -> bool:
+    """Converts every input JXE into output dir and prints result table.
+
+    Returns True if all files were converted.
+    """
+    jxe_names = expand_inputs(args.inputs)
+    jar_names = batch_jar_names(jxe_names, args.output_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
+    rows = []
+    for jxe_name, jar_name in zip(jxe_names, jar_names):
+        start = time.perf_counter()
+        if args.incremental is not None:
+            options["old_jar"] = os.path.join(
+                args.incremental, os.path.basename(jar_name)
+            )
+        try:
+            written, skipped = write_jar(jxe_name, jar_name, **options)
+        except Exception as exc:  # pylint: disable=W0718
+            logger.error("convert failed: %s: %s", jxe_name, exc)
+            rows.append((jxe_name, "-", "-", "-", f"failed: {exc}"))
+            continue
+        rows.append(
+            (
+                jxe_name,
+                str(written),
+                str(skipped),
+                f"{time.perf_counter() - start:.2f}",
+                "ok" if not skipped else "partial",
+            )
+        )
+    print_table(("jxe", "classes", "skipped", "seconds", "status"), rows)
+    return all(not row[4].startswith("failed") for row in rows)
+
+
+def print_table(header, rows) -> None:
+    """Prints rows as left aligned text columns."""
+    widths = [max(len(row[i]) for row in (header, *rows)) for i in range(len(header))]
+    for row in (header, *rows):
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Converts JXE to JAR file.",
+        fromfile_prefix_chars="@",
+        usage="%(prog)s [options] jxe jar\n"
+        "       %(prog)s [options] -d DIR jxe|dir|glob|@list ...\n"
+        "       %(prog)s --list [options] jxe ...",
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        metavar="path",
+        help="input JXE and output JAR, or only input JXEs with -d",
+    )
+    parser.add_argument(
+        "-d",
+        "--output-dir",
+        metavar="DIR",
+        help="batch mode: convert every input into DIR/<name>.jar",
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="print selected class names from the TOC instead of converting",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="GLOB",
+        help="convert only classes matching package glob, e.g. 'com.foo.*'",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        metavar="GLOB",
+        help="skip classes matching package glob",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes converting classes (0: CPU count)",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=COMPRESSION,
+        default="store",
+        help="JAR entry compression, deflate runs in a thread pool (default: store)",
+    )
+    parser.add_argument(
+        "--level",
+        type=int,
+        choices=range(10),
+        default=6,
+        metavar="0-9",
+        help="deflate compression level (default: 6)",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="directory caching converted classes by ROM class content",
+    )
+    parser.add_argument(
+        "--no-resources",
+        dest="resources",
+        action="store_false",
+        help="don't copy non-class JXE members into the JAR",
+    )
+    parser.add_argument(
+        "--incremental",
+        metavar="JAR",
+        help="copy classes unchanged since JAR (a directory of JARs with -d) "
+        "instead of converting them, may be the output itself (implies --manifest)",
+    )
+    parser.add_argument(
+        "--manifest",
+        action="store_true",
+        help=f"add {MANIFEST_NAME} of class keys, read by later --incremental runs",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="JSON",
+        help="write per-stage and per-class timing report (implies -j 1)",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=10,
+        metavar="N",
+        help="slowest classes listed in the profile report (default: 10)",
+    )
+    parser.add_argument(
+        "--pstats",
+        metavar="FILE",
+        help="run under cProfile and dump pstats to FILE",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="show progress (-v) and debug (-vv) messages",
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="show errors only")
+    args = parser.parse_args(argv)
+    if args.output_dir is None and not args.list:
+        if len(args.inputs) != 2:
+            parser.error("expected jxe and jar, or -d DIR for batch mode")
+        args.jxe, args.jar = args.inputs
+    args.verbosity = -1 if args.quiet else args.verbose
+    if args.jobs <= 0:
+        args.jobs = os.cpu_count() or 1
+    return args
 
 
 def _main():
-    jxe_name = sys.argv[1]
-    jar_name = sys.argv[2]
-    with open(jxe_name, "rb") as fp_jar:
-        stream = ReaderStream(fp_jar)
-        jxe = JXE.read(stream)
-        _create_jar(jar_name, jxe)
+    args = _parse_args()
+    counter = setup_logging(args.verbosity)
+    if args.list:
+        list_classes(expand_inputs(args.inputs), args.include, args.exclude)
+        return
+    profiler = NULL_PROFILER
+    if args.profile is not None:
+        profiler = Profiler()
+        if args.jobs > 1:
+            logger.warning("profile: converting in-process, -j %d ignored", args.jobs)
+            args.jobs = 1
+    with contextlib.ExitStack() as stack:
+        if args.pstats is not None:
+            pstats_profile = cProfile.Profile()
+            stack.callback(pstats_profile.dump_stats, args.pstats)
+            stack.enter_context(pstats_profile)
+        # One pool and cache serve every JXE of a batch
+        options = {
+            "executor": start_worker_pool(stack, args.jobs) if args.jobs > 1 else None,
+            "jobs": args.jobs,
+            "cache": ClassCache(args.cache) if args.cache is not None else None,
+            "compression": args.compress,
+            "level": args.level,
+            "include": args.include,
+            "exclude": args.exclude,
+            "profiler": profiler,
+            "resources": args.resources,
+            "manifest": args.manifest,
+        }
+        if args.output_dir is not None:
+            try:
+                success = _run_batch(args, **options)
+            except ValueError as exc:
+                logger.error("bad batch: %s", exc)
+                success = False
+        else:
+            write_jar(args.jxe, args.jar, old_jar=args.incremental, **options)
+            success = True
+    if args.profile is not None:
+        profiler.write(args.profile, args.profile_top)
+    summary = counter.summary()
+    if summary and args.verbosity >= 0:
+        print(summary, file=sys.stderr)
+    if not success:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+"""Profiling class."""
+import json
+import time
+
+STAGES = ("image", "parse", "cp_build", "transform", "serialize", "zip")
+
+
+class NullProfiler:
+    """Profiler doing nothing, default of the conversion pipeline."""
+
+    def start_class(self, class_name: str) -> None:
+        """Starts timing of a class."""
+
+    def lap(self, stage: str) -> None:
+        """Adds time since previous lap to stage."""
+
+    def note(self, **counters) -> None:
+        """Sets counters of current class."""
+
+    def end_class(self, bytes_out: int = 0) -> None:
+        """Finishes timing of current class."""
+
+    def start(self) -> None:
+        """Restarts lap clocks, time since previous lap isn't attributed."""
+
+    def add_file(self, jxe_name: str, bytes_in: int, bytes_out: int) -> None:
+        """Records sizes of a converted JXE and its JAR."""
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler(NullProfiler):
+    """Collects per-stage wall/CPU time and per-class counters.
+
+    The pipeline calls lap(stage) at each stage boundary, so every interval
+    between two laps is attributed to exactly one stage.
+    """
+
+    def __init__(self):
+        self.stages = {stage: [0.0, 0.0] for stage in STAGES}
+        self.classes = []
+        self.files = []
+        self._last_ = (time.perf_counter(), time.process_time())
+        self._class_ = None
+
+    def start(self) -> None:
+        self._last_ = (time.perf_counter(), time.process_time())
+
+    def start_class(self, class_name: str) -> None:
+        self.start()
+        self._class_ = {"name": class_name, "wall": 0.0, "cpu": 0.0}
+
+    def lap(self, stage: str) -> None:
+        wall, cpu = time.perf_counter(), time.process_time()
+        wall_delta = wall - self._last_[0]
+        cpu_delta = cpu - self._last_[1]
+        self._last_ = (wall, cpu)
+        totals = self.stages.setdefault(stage, [0.0, 0.0])
+        totals[0] += wall_delta
+        totals[1] += cpu_delta
+        if self._class_ is not None:
+            self._class_["wall"] += wall_delta
+            self._class_["cpu"] += cpu_delta
+
+    def note(self, **counters) -> None:
+        if self._class_ is not None:
+            self._class_.update(counters)
+
+    def end_class(self, bytes_out: int = 0) -> None:
+        if self._class_ is not None:
+            self._class_["bytes_out"] = bytes_out
+            self.classes.append(self._class_)
+            self._class_ = None
+
+    def add_file(self, jxe_name: str, bytes_in: int, bytes_out: int) -> None:
+        self.files.append(
+            {"jxe": jxe_name, "bytes_in": bytes_in, "bytes_out": bytes_out}
+        )
+
+    def report(self, top: int = 10) -> dict:
+        """Returns JSON serializable report with top slowest classes."""
+        stages = {
+            stage: {"wall": wall, "cpu": cpu}
+            for stage, (wall, cpu) in self.stages.items()
+        }
+        classes = self.classes
+        return {
+            "stages": stages,
+            "total": {
+                "wall": sum(stage["wall"] for stage in stages.values()),
+                "cpu": sum(stage["cpu"] for stage in stages.values()),
+            },
+            "files": self.files,
+            "classes": len(classes),
+            "bytes_in": sum(file["bytes_in"] for file in self.files),
+            "bytes_out": sum(file["bytes_out"] for file in self.files),
+            "rom_bytes": sum(one.get("rom_size", 0) for one in classes),
+            "class_bytes": sum(one["bytes_out"] for one in classes),
+            "rom_cp_entries": sum(one.get("rom_cp", 0) for one in classes),
+            "cp_entries": sum(one.get("cp", 0) for one in classes),
+            "max_cp_entries": max((one.get("cp", 0) for one in classes), default=0),
+            "slowest": sorted(classes, key=lambda one: one["wall"], reverse=True)[:top],
+        }
+
+    def write(self, path: str, top: int = 10) -> None:
+        """Writes JSON report to path."""
+        with open(path, "w", encoding="utf-8") as fp_report:
+            json.dump(self.report(top), fp_report, indent=2)
@@ -0,0 +1,212 @@
+"""Conversion server class.
+
+Protocol over a Unix stream socket, one request per connection: the client
+sends a JSON line, followed by payload_size bytes of JXE if set, and gets a
+JSON line back, followed by jar_size bytes of JAR if set.
+
+Request keys: command ("convert", "status" or "stop"), jxe (absolute path)
+or payload_size, jar (absolute path, JAR is sent back if missing) and the
+write_jar options compression, level, include, exclude, incremental,
+resources and manifest.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from cache import ClassCache
+from common import WarningCounter, logger, setup_logging
+from jxe2jar import start_worker_pool, write_jar
+
+OPTIONS = ("compression", "level", "include", "exclude", "resources", "manifest")
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # Connection probe, see remove_stale_socket
+            return
+        try:
+            request = json.loads(line)
+            payload = None
+            if request.get("payload_size") is not None:
+                payload = self.rfile.read(request["payload_size"])
+            response, jar = self.server.dispatch(request, payload)
+        except Exception as exc:  # pylint: disable=W0718
+            logger.error("bad request: %s", exc)
+            response, jar = {"ok": False, "error": str(exc)}, None
+        if jar is not None:
+            response["jar_size"] = len(jar)
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        if jar is not None:
+            self.wfile.write(jar)
+
+
+class ConversionServer(socketserver.UnixStreamServer):
+    """Converts JXEs for clients of a Unix socket on a persistent worker pool.
+
+    Requests are served one at a time, each using the whole pool, while
+    worker images, the class cache and imported modules stay warm. A pool
+    broken by a dead worker is replaced.
+    """
+
+    def __init__(self, path: str, jobs: int = 1, cache=None):
+        super().__init__(path, _RequestHandler)
+        self.jobs = jobs
+        self.cache = cache
+        self.executor = None
+        self.requests = 0
+        self.pool_restarts = 0
+        self.started = time.time()
+        self._pool_stack_ = contextlib.ExitStack()
+        self._start_pool()
+
+    def _start_pool(self) -> None:
+        """Shuts down current worker pool and starts a new one if jobs > 1."""
+        self._pool_stack_.close()
+        self.executor = None
+        if self.jobs > 1:
+            self.executor = start_worker_pool(self._pool_stack_, self.jobs)
+
+    def server_close(self):
+        super().server_close()
+        self._pool_stack_.close()
+
+    def dispatch(self, request: dict, payload):
+        """Returns (response, JAR bytes or None) of request."""
+        command = request.get("command", "convert")
+        self.requests += 1
+        if command == "status":
+            return {
+                "ok": True,
+                "pid": os.getpid(),
+                "jobs": self.jobs,
+                "requests": self.requests,
+                "pool_restarts": self.pool_restarts,
+                "cache_hits": self.cache.hits if self.cache else None,
+                "cache_misses": self.cache.misses if self.cache else None,
+                "uptime": time.time() - self.started,
+            }, None
+        if command == "stop":
+            # shutdown() waits for serve_forever, which is running this handler
+            threading.Thread(target=self.shutdown).start()
+            return {"ok": True}, None
+        if command != "convert":
+            raise ValueError(f"Unknown command: '{command}'")
+        return self.convert(request, payload)
+
+    def convert(self, request: dict, payload):
+        """Runs conversion request, returns (response, JAR bytes or None)."""
+        counter = WarningCounter()
+        logger.addHandler(counter)
+        start = time.perf_counter()
+        jar = request.get("jar")
+        out = io.BytesIO() if jar is None else jar
+        try:
+            written, skipped = self._write_jar(request, payload, out)
+        except Exception as exc:  # pylint: disable=W0718
+            logger.error("convert failed: %s", exc)
+            return {"ok": False, "error": str(exc)}, None
+        finally:
+            logger.removeHandler(counter)
+        response = {
+            "ok": True,
+            "written": written,
+            "skipped": skipped,
+            "seconds": time.perf_counter() - start,
+            "warnings": counter.summary(),
+        }
+        return response, out.getvalue() if jar is None else None
+
+    def _write_jar(self, request: dict, payload, out):
+        """Runs write_jar, retrying once on a new pool if a worker died."""
+        for retry in (True, False):
+            try:
+                return write_jar(
+                    payload if payload is not None else request["jxe"],
+                    out,
+                    executor=self.executor,
+                    jobs=self.jobs,
+                    cache=self.cache,
+                    old_jar=request.get("incremental"),
+                    **{key: request[key] for key in OPTIONS if key in request},
+                )
+            except BrokenProcessPool as exc:
+                logger.warning("worker pool broken, restarting: %s", exc)
+                self.pool_restarts += 1
+                self._start_pool()
+                if not retry:
+                    raise
+                if isinstance(out, io.BytesIO):
+                    out.seek(0)
+                    out.truncate()
+
+
+def remove_stale_socket(path: str) -> None:
+    """Removes socket file left by a dead server, raises if one still listens."""
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+            return
+    raise OSError(f"Server already listening on '{path}'")
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serves JXE to JAR conversions on a Unix socket."
+    )
+    parser.add_argument("socket", help="Unix socket path to listen on")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes converting classes (0: CPU count)",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="directory caching converted classes by ROM class content",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="show progress (-v) and debug (-vv) messages",
+    )
+    args = parser.parse_args(argv)
+    if args.jobs <= 0:
+        args.jobs = os.cpu_count() or 1
+    return args
+
+
+def _main():
+    args = _parse_args()
+    setup_logging(args.verbose)
+    with contextlib.ExitStack() as stack:
+        cache = ClassCache(args.cache) if args.cache is not None else None
+        remove_stale_socket(args.socket)
+        server = stack.enter_context(ConversionServer(args.socket, args.jobs, cache))
+        stack.callback(os.unlink, args.socket)
+        print(f"Listening on {args.socket}", file=sys.stderr)
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        with contextlib.suppress(KeyboardInterrupt):
+            server.serve_forever()
+
+
+if __name__ == "__main__":
+    _main()